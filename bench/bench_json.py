@@ -0,0 +1,90 @@
+"""
+列表接口 JSON 解码基准测试
+
+用 fixtures 中录制的 appmsgpublish 响应，比较各解码方式（msgspec / orjson / 标准库 json，未安装的跳过）
+完成 响应解码 + publish_page 解析 所需的时间，并与原来三次 json.loads、逐篇构造字典的实现对比。
+
+用法:
+    python bench/bench_json.py
+    python bench/bench_json.py --pages 20000
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, BENCH_DIR)
+
+from run_bench import load_crawler  # noqa: E402
+
+FIXTURE = os.path.join(BENCH_DIR, "fixtures", "appmsgpublish_page.json")
+
+
+def parse_baseline(content):
+    """原来的实现：整个响应、publish_page、每个 publish_info 都用 json.loads 解析为字典"""
+    data = json.loads(content)
+    publish_page = json.loads(data["publish_page"])
+    articles = []
+    for publish_item in publish_page.get("publish_list", []):
+        publish_info = json.loads(publish_item.get("publish_info", "{}"))
+        for appmsg in publish_info.get("appmsg_info", []):
+            articles.append({
+                "title": appmsg.get("title"),
+                "link": appmsg.get("content_url"),
+                "create_time": publish_info.get("sent_info", {}).get("time", 0),
+                "msgid": publish_info.get("msgid", 0),
+                "digest": appmsg.get("digest", ""),
+                "author": appmsg.get("author", "")
+            })
+    return articles, publish_page.get("total_count", 0)
+
+
+def timed(funcs, content, pages, rounds=5):
+    """各解码方式轮流计时，取每种方式最快的一轮，避免机器负载变化只影响其中一种"""
+    best = {}
+    for _ in range(rounds):
+        for name, func in funcs.items():
+            start = time.perf_counter()
+            for _ in range(pages):
+                func(content)
+            elapsed = time.perf_counter() - start
+            best[name] = min(elapsed, best.get(name, elapsed))
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description="列表接口 JSON 解码基准测试")
+    parser.add_argument("--pages", type=int, default=2000, help="每种解码方式解析的列表页数")
+    args = parser.parse_args()
+
+    crawler = load_crawler()
+    with open(FIXTURE, "rb") as f:
+        content = f.read()
+
+    expected, expected_total = parse_baseline(content)
+    backends = [name for name, module in (("msgspec", crawler.msgspec), ("orjson", crawler.orjson), ("json", json))
+                if module is not None]
+    funcs = {"baseline": parse_baseline}
+    for backend in backends:
+        def parse(data, backend=backend):
+            return crawler.parse_publish_page(crawler.decode_json(data, backend), backend)
+        articles, total = parse(content)
+        # 解析结果必须与原来的实现一致
+        assert total == expected_total and len(articles) == len(expected)
+        for article, reference in zip(articles, expected):
+            assert all(article.get(key) == value for key, value in reference.items()), (backend, reference)
+        funcs[backend] = parse
+    results = timed(funcs, content, args.pages)
+
+    print(f"响应大小: {len(content)} 字节，每页 {len(expected)} 篇文章，解析 {args.pages} 页")
+    print(f"{'解码方式':<12}{'每页us':>10}{'页/秒':>12}{'加速':>8}")
+    baseline = results["baseline"]
+    for name, elapsed in results.items():
+        per_page = elapsed / args.pages
+        print(f"{name:<12}{per_page * 1e6:>10.1f}{1 / per_page:>12.0f}{baseline / elapsed:>7.2f}x")
+
+
+if __name__ == "__main__":
+    main()
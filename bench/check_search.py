@@ -0,0 +1,70 @@
+"""
+全文检索回归检查
+
+把几段样例文章写入临时的 search.db，检查单个汉字、中英混排、带标点和跨段的关键词
+都能检索到对应的文章，不该命中的关键词不命中。结果不对时报错退出。
+
+用法:
+    python bench/check_search.py
+"""
+import os
+import sys
+import tempfile
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, BENCH_DIR)
+
+from run_bench import load_crawler  # noqa: E402
+
+DOCUMENTS = {
+    "a.md": "# 华中见闻\n\n我们在华中。",
+    "b.md": "# 大模型\n\n最新的大模型GPT-4发布了，中国，人民都很关注。",
+    "c.md": "# 其他\n\n华中科技大学 中华人民共和国",
+    "d.md": "# 型号\n\n本次发布的是型G版本，与GPT中文版不同。",
+}
+
+# 关键词 -> 应当命中的文章
+CASES = {
+    "中": {"a.md", "b.md", "c.md", "d.md"},
+    "闻": {"a.md"},
+    "民": {"b.md", "c.md"},
+    "华中": {"a.md", "c.md"},
+    "在华中": {"a.md"},
+    "模型GPT": {"b.md"},
+    "型G": {"d.md"},
+    "型GPT": {"b.md"},
+    "GPT中文": {"d.md"},
+    "gpt-4": {"b.md"},
+    "中国，人民": {"b.md"},
+    "中国 人民": {"b.md"},
+    "科技大学": {"c.md"},
+    "人民共和国": {"c.md"},
+    "华中 大学": {"c.md"},
+    "中华人民共和国华中": set(),
+    "国人": set(),
+}
+
+
+def main():
+    crawler = load_crawler()
+    failures = []
+    with tempfile.TemporaryDirectory(prefix="wx_search_") as workdir:
+        index = crawler.SearchIndex(os.path.join(workdir, "search.db"))
+        for path, markdown in DOCUMENTS.items():
+            index.add(path, markdown)
+        for query, expected in CASES.items():
+            found = {doc["path"] for doc in index.search(query, limit=100)}
+            status = "ok" if found == expected else "FAIL"
+            print(f"{status:<6}{query:<16}{crawler.build_match_query(query):<28}{sorted(found)}")
+            if found != expected:
+                failures.append((query, sorted(expected), sorted(found)))
+        index.close()
+    for query, expected, found in failures:
+        print(f"{query}: 期望 {expected}，实际 {found}")
+    if failures:
+        sys.exit(1)
+    print(f"全部 {len(CASES)} 个查询通过")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,217 @@
+"""
+爬取流程基准测试
+
+使用 fixtures 中录制的 appmsgpublish 响应和文章页面，通过本地桩服务器运行存档模式和更新模式，
+统计 文章数/秒、字节数/秒、峰值内存 以及各阶段耗时，全程不访问网络。
+
+用法:
+    python bench/run_bench.py
+    python bench/run_bench.py --accounts 10 --publishes 50 --json bench_output.json
+"""
+import argparse
+import contextlib
+import importlib.util
+import io
+import json
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, BENCH_DIR)
+
+from stub_server import StubServer  # noqa: E402
+
+CRAWLER_PATH = os.path.join(os.path.dirname(BENCH_DIR), "wechat_crawler.py.py")
+
+# 需要计时的阶段：阶段名 -> 爬虫模块中的函数名
+STAGES = {
+    "list_fetch": "get_articles",
+    "list_parse": "parse_publish_page",
+    "convert": "html_to_markdown",
+    "article_total": "save_url_to_md",
+}
+
+
+def load_crawler():
+    spec = importlib.util.spec_from_file_location("wechat_crawler", CRAWLER_PATH)
+    module = importlib.util.module_from_spec(spec)
+    # 注册到 sys.modules，转换进程池才能按模块名找到函数
+    sys.modules[spec.name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+def peak_rss_mb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux 单位为 KB，macOS 为字节
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def instrument(crawler, timings):
+    """用计时包装替换模块中的阶段函数"""
+    lock = threading.Lock()
+
+    def wrap(stage, func):
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                elapsed = time.perf_counter() - start
+                with lock:
+                    timings.setdefault(stage, []).append(elapsed)
+        return timed
+
+    for stage, name in STAGES.items():
+        setattr(crawler, name, wrap(stage, getattr(crawler, name)))
+
+
+def summarize(samples):
+    samples = sorted(samples)
+    return {
+        "count": len(samples),
+        "mean_ms": round(statistics.mean(samples) * 1000, 3),
+        "p50_ms": round(samples[len(samples) // 2] * 1000, 3),
+        "p95_ms": round(samples[min(len(samples) - 1, int(len(samples) * 0.95))] * 1000, 3),
+        "total_s": round(sum(samples), 3),
+    }
+
+
+def run_mode(mode, args, verbose=False):
+    workdir = tempfile.mkdtemp(prefix=f"wx_bench_{mode}_")
+    cwd = os.getcwd()
+    try:
+        with StubServer(publishes=args.publishes, freq_control_every=args.freq_control_every) as stub:
+            os.chdir(workdir)
+            config = {
+                "token": "bench",
+                "cookie": "bench",
+                "mp_base_url": stub.base_url,
+                "min_file_size_kb": 0,
+                "api_rate_per_second": args.api_rate,
+                "api_max_rate_per_second": args.api_rate,
+                "api_backoff_seconds": 0.05,
+                "fetch_workers": args.fetch_workers,
+                "per_host_concurrency": args.fetch_workers,
+                "account_workers": args.account_workers,
+            }
+            config.update(args.extra_config)
+            with open("config.json", "w", encoding="utf-8") as f:
+                json.dump(config, f)
+            fakeids = [f"BENCH{i:04d}==" for i in range(args.accounts)]
+            with open("gzh.txt", "w", encoding="utf-8") as f:
+                f.write("\n".join(fakeids) + "\n")
+            with open("公众号名字", "w", encoding="utf-8") as f:
+                f.write("\n".join(f"基准号{i}" for i in range(args.accounts)) + "\n")
+
+            crawler = load_crawler()
+            crawler.MP_BASE_URL = stub.base_url
+            timings = {}
+            instrument(crawler, timings)
+            account_names = crawler.load_account_names()
+
+            output = sys.stdout if verbose else io.StringIO()
+            start = time.perf_counter()
+            with contextlib.redirect_stdout(output):
+                if mode == "archive":
+                    crawler.mode_archive(fakeids, "bench", "bench", account_names)
+                else:
+                    crawler.mode_update(fakeids, "bench", "bench", {}, account_names)
+            elapsed = time.perf_counter() - start
+
+            saved = 0
+            saved_bytes = 0
+            for root, _, files in os.walk(crawler.ARTICLES_BASE_DIR):
+                for name in files:
+                    if name.endswith(".md"):
+                        saved += 1
+                        saved_bytes += os.path.getsize(os.path.join(root, name))
+
+            return {
+                "mode": mode,
+                "elapsed_s": round(elapsed, 3),
+                "articles": saved,
+                "articles_per_s": round(saved / elapsed, 2) if elapsed else 0.0,
+                "bytes_downloaded": stub.bytes_sent,
+                "bytes_per_s": round(stub.bytes_sent / elapsed) if elapsed else 0,
+                "markdown_bytes": saved_bytes,
+                "list_requests": stub.list_requests,
+                "article_requests": stub.article_requests,
+                "peak_rss_mb": peak_rss_mb(),
+                "rate_limiter": rate_limiter_stats(crawler.metrics.snapshot()),
+                "stages": {stage: summarize(samples) for stage, samples in timings.items() if samples},
+            }
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def rate_limiter_stats(snapshot):
+    """从爬虫发布的指标中取出列表接口限速器的统计"""
+    counters, gauges = snapshot["counters"], snapshot["gauges"]
+    return {
+        "requests": counters.get("api_requests_total", 0),
+        "throttles": counters.get("api_throttles_total", 0),
+        "retries": counters.get("api_retries_total", 0),
+        "rate": gauges.get("api_rate_per_second", 0.0),
+        "effective_rps": gauges.get("api_effective_rps", 0.0),
+    }
+
+
+def print_report(result):
+    print(f"\n=== {result['mode']} ===")
+    print(f"耗时: {result['elapsed_s']} s")
+    print(f"文章: {result['articles']} 篇 ({result['articles_per_s']} 篇/秒)")
+    print(f"下载: {result['bytes_downloaded']} 字节 ({result['bytes_per_s']} 字节/秒)")
+    print(f"请求: 列表 {result['list_requests']} 次, 文章 {result['article_requests']} 次")
+    limiter = result["rate_limiter"]
+    print(f"限速: 请求 {limiter['requests']} 次, 限流 {limiter['throttles']} 次, 重试 {limiter['retries']} 次, "
+          f"当前速率 {limiter['rate']} 次/秒, 实际 {limiter['effective_rps']} 次/秒")
+    if result["peak_rss_mb"] is not None:
+        print(f"峰值内存: {result['peak_rss_mb']:.1f} MB")
+    print(f"{'阶段':<16}{'次数':>8}{'平均ms':>12}{'p50ms':>12}{'p95ms':>12}{'合计s':>10}")
+    for stage, s in result["stages"].items():
+        print(f"{stage:<16}{s['count']:>8}{s['mean_ms']:>12}{s['p50_ms']:>12}{s['p95_ms']:>12}{s['total_s']:>10}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="微信公众号爬虫基准测试（本地桩服务器）")
+    parser.add_argument("--mode", choices=["archive", "update", "all"], default="all")
+    parser.add_argument("--accounts", type=int, default=4, help="公众号数量")
+    parser.add_argument("--publishes", type=int, default=20, help="每个公众号的发布次数")
+    parser.add_argument("--fetch-workers", type=int, default=4)
+    parser.add_argument("--account-workers", type=int, default=4)
+    parser.add_argument("--api-rate", type=float, default=200.0, help="列表接口限速（次/秒）")
+    parser.add_argument("--freq-control-every", type=int, default=0, help="每 N 次列表请求模拟一次频率限制")
+    parser.add_argument("--config", dest="extra_config", type=json.loads, default={},
+                        help='额外的 config.json 配置，JSON 格式，如 \'{"markdown_converter": "legacy"}\'')
+    parser.add_argument("--json", help="将结果写入 JSON 文件，便于对比回归")
+    parser.add_argument("--verbose", action="store_true", help="显示爬虫输出")
+    args = parser.parse_args()
+
+    modes = ["archive", "update"] if args.mode == "all" else [args.mode]
+    results = []
+    for mode in modes:
+        result = run_mode(mode, args, verbose=args.verbose)
+        print_report(result)
+        results.append(result)
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=4, ensure_ascii=False)
+
+
+if __name__ == "__main__":
+    main()
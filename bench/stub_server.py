@@ -0,0 +1,123 @@
+"""
+本地桩服务器：用 fixtures 中录制的响应模拟 mp.weixin.qq.com
+- /cgi-bin/appmsgpublish  按 fakeid/begin/count 生成文章列表（结构与 appmsgpublish_page.json 相同）
+- /s?__biz=...&mid=...     返回 article_*.html 中的文章页面（正文开头带文章编号，每篇内容不同）
+"""
+import glob
+import json
+import os
+import re
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+JS_CONTENT_RE = re.compile(rb'<div[^>]*id="js_content"[^>]*>')
+
+
+def load_fixtures():
+    with open(os.path.join(FIXTURES_DIR, "appmsgpublish_page.json"), "r", encoding="utf-8") as f:
+        list_page = json.load(f)
+    with open(os.path.join(FIXTURES_DIR, "appmsgpublish_freq_control.json"), "rb") as f:
+        freq_control = f.read()
+    articles = []
+    for path in sorted(glob.glob(os.path.join(FIXTURES_DIR, "article_*.html"))):
+        with open(path, "rb") as f:
+            articles.append(f.read())
+    return list_page, freq_control, articles
+
+
+class StubServer:
+    """
+    在后台线程运行的桩服务器
+    - publishes: 每个公众号的发布次数（每次发布包含 1~2 篇文章，与录制数据一致）
+    - freq_control_every: 每 N 次列表请求返回一次频率限制，0 表示不限制
+    """
+
+    def __init__(self, publishes=20, freq_control_every=0):
+        self.publishes = publishes
+        self.freq_control_every = freq_control_every
+        self.list_page, self.freq_control, self.articles = load_fixtures()
+        publish_page = json.loads(self.list_page["publish_page"])
+        self.templates = [json.loads(item["publish_info"]) for item in publish_page["publish_list"]]
+        self.list_requests = 0
+        self.article_requests = 0
+        self.bytes_sent = 0
+        self.lock = threading.Lock()
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        self.base_url = f"http://127.0.0.1:{self.httpd.server_port}"
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def list_response(self, fakeid, begin, count):
+        with self.lock:
+            self.list_requests += 1
+            n = self.list_requests
+        if self.freq_control_every and n % self.freq_control_every == 0:
+            return self.freq_control
+
+        publish_list = []
+        for i in range(begin, min(self.publishes, begin + count)):
+            info = json.loads(json.dumps(self.templates[i % len(self.templates)]))
+            msgid = 2247480000 - i
+            publish_time = 1706250000 - i * 43200
+            info["msgid"] = msgid
+            info["sent_info"]["time"] = publish_time
+            for appmsg in info["appmsg_info"]:
+                idx = appmsg["itemidx"]
+                appmsg["title"] = f"{fakeid} 文章 {i}-{idx}"
+                appmsg["content_url"] = f"{self.base_url}/s?__biz={fakeid}&mid={msgid}&idx={idx}&sn=bench{i:05d}&chksm=ea1b2c3d#rd"
+            publish_list.append({"publish_type": 101, "publish_info": json.dumps(info, ensure_ascii=False)})
+
+        page = json.loads(self.list_page["publish_page"])
+        page["total_count"] = self.publishes
+        page["publish_list"] = publish_list
+        data = dict(self.list_page, publish_page=json.dumps(page, ensure_ascii=False))
+        return json.dumps(data, ensure_ascii=False).encode("utf-8")
+
+    def article_response(self, biz, mid, idx):
+        with self.lock:
+            self.article_requests += 1
+        # 在正文开头插入文章编号，使每篇文章内容不同，避免被内容去重合并
+        page = self.articles[mid % len(self.articles)]
+        marker = f"<p>{biz} {mid}-{idx}</p>".encode("utf-8")
+        return JS_CONTENT_RE.sub(lambda m: m.group(0) + marker, page, count=1)
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                url = urlparse(self.path)
+                query = parse_qs(url.query)
+                if url.path == "/cgi-bin/appmsgpublish":
+                    body = server.list_response(query["fakeid"][0], int(query["begin"][0]), int(query["count"][0]))
+                    content_type = "application/json; charset=UTF-8"
+                elif url.path == "/s":
+                    body = server.article_response(query.get("__biz", [""])[0], int(query.get("mid", ["0"])[0]),
+                                                   query.get("idx", ["1"])[0])
+                    content_type = "text/html; charset=UTF-8"
+                else:
+                    self.send_error(404)
+                    return
+                with server.lock:
+                    server.bytes_sent += len(body)
+                self.send_response(200)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
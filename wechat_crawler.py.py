@@ -1,16 +1,120 @@
 import requests
 import json
 import time
+import argparse
+import atexit
+import asyncio
+import codecs
+import contextlib
+import cProfile
+import functools
+import gzip
+import pstats
+import hashlib
+import shutil
+import tempfile
 import os
+import queue
 import re
+import random
+import socket
+import sqlite3
+import sys
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import html
+from typing import List, Optional, Union
+from urllib.parse import parse_qs, urlencode, urlparse
+from requests.adapters import HTTPAdapter
+
+# 异步引擎的 HTTP 客户端（可选依赖），都未安装时在线程池中使用 requests
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+try:
+    import httpx
+except ImportError:
+    httpx = None
+# 分段存储的 zstd 压缩（可选依赖），未安装时使用 gzip
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+# 列表接口的 JSON 解码（可选依赖），未安装时使用标准库 json
+try:
+    import msgspec
+except ImportError:
+    msgspec = None
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
 # 配置和数据文件路径
 CONFIG_FILE = "config.json"
 FAKEID_FILE = "gzh.txt"
 ACCOUNT_NAMES_FILE = "公众号名字"
 HISTORY_FILE = "history.json"
+STATE_DB_FILE = "state.db"
+SEARCH_DB_FILE = "search.db"
+SNAPSHOT_DB_FILE = "snapshots.db"
+HTTP_CACHE_DIR = ".http_cache"
 OUTPUT_FILE = "wx_poc.txt"
 ARTICLES_BASE_DIR = "公众号文章"
+SCHEDULE_FILE = "schedule.json"
+# 分片批量存档的输出目录，每个分片一个子目录（state.db、wx_poc.txt、公众号文章/）
+SHARDS_DIR = "shards"
+
+# 公众号后台接口地址，可在 config.json 中用 mp_base_url 指向本地桩服务器
+MP_BASE_URL = "https://mp.weixin.qq.com"
+# base_resp.ret 频率限制错误码
+FREQ_CONTROL_RET = 200013
+# 文章列表每页请求的发布条数
+LIST_PAGE_SIZE = 10
+
+# 并发抓取默认值
+DEFAULT_FETCH_WORKERS = 4
+DEFAULT_PER_HOST_CONCURRENCY = 2
+DEFAULT_ACCOUNT_WORKERS = 4
+# 异步引擎同时进行的最大请求数
+DEFAULT_ASYNC_MAX_IN_FLIGHT = 64
+# 下载或转换失败的文章最多尝试的次数
+DEFAULT_ARTICLE_MAX_ATTEMPTS = 5
+# 正文指纹登记超过这么久（秒）仍没有对应文件时视为原文已中断，相同内容的文章可以接管
+CONTENT_CLAIM_STALE_SECONDS = 3600
+# Markdown 转换器版本，修改转换输出时加一，--reconvert 会重新转换用旧版本生成的文章
+CONVERTER_VERSION = 1
+# 流式下载每次读取的字节数
+STREAM_CHUNK_SIZE = 16 * 1024
+
+# 图片镜像：请求头（微信图片 CDN 校验 Referer）和扩展名映射
+IMAGE_HEADERS = {
+    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/143.0.0.0 Safari/537.36 Edg/143.0.0.0",
+    "Referer": "https://mp.weixin.qq.com/",
+}
+IMAGE_EXTENSIONS = {"png": "png", "jpeg": "jpg", "jpg": "jpg", "gif": "gif", "webp": "webp", "bmp": "bmp", "svg+xml": "svg", "svg": "svg"}
+
+_config = None
+_session = None
+_session_pool_size = 0
+_session_lock = threading.Lock()
+_host_slots = {}
+_per_host_limit = DEFAULT_PER_HOST_CONCURRENCY
+_rate_limiter = None
+_log_writer = None
+_notifier = None
+_state_store = None
+_http_cache = None
+_segment_store = None
+_search_index = None
+_snapshot_store = None
+_convert_pool = None
+_convert_pool_size = 0
+# 分片批量存档时为 (分片号, 分片总数)
+_shard = None
 
 def load_json(filepath):
     if os.path.exists(filepath):
@@ -21,10 +125,53 @@ def load_json(filepath):
                 return {}
     return {}
 
+def get_config(reload=False):
+    """
+    读取 config.json 并缓存，每轮检查开始时 reload=True 重新读取
+    避免每篇文章、每次请求都重新读取配置文件
+    """
+    global _config
+    if _config is None or reload:
+        _config = load_json(CONFIG_FILE)
+    return _config
+
+def atomic_write(filepath, data):
+    """
+    先写入同目录的临时文件并 fsync，再改名为 filepath
+    读者只会看到旧文件或完整的新文件，写入中途崩溃也不会留下损坏的文件
+    """
+    directory = os.path.dirname(os.path.abspath(filepath))
+    fd, tmp_path = tempfile.mkstemp(prefix=os.path.basename(filepath) + ".", suffix=".tmp", dir=directory)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, filepath)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    fsync_dir(directory)
+
+def fsync_dir(directory):
+    """把目录项的修改（新建、改名）刷到磁盘，Windows 不支持时跳过"""
+    if not hasattr(os, "O_DIRECTORY"):
+        return
+    try:
+        fd = os.open(directory, os.O_RDONLY | os.O_DIRECTORY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
 def save_json(filepath, data):
     # 保存 JSON 时保留中文
-    with open(filepath, "w", encoding="utf-8") as f:
-        json.dump(data, f, indent=4, ensure_ascii=False)
+    atomic_write(filepath, json.dumps(data, indent=4, ensure_ascii=False).encode("utf-8"))
 
 def load_fakeids():
     if not os.path.exists(FAKEID_FILE):
@@ -39,6 +186,11 @@ def load_account_names():
         names = [line.strip() for line in f if line.strip()]
     return {i: name for i, name in enumerate(names)}
 
+def load_fakeids_by_name():
+    """公众号名称 -> fakeid（按行号对应 gzh.txt 和 公众号名字）"""
+    names = load_account_names()
+    return {names[i]: fakeid for i, fakeid in enumerate(load_fakeids()) if i in names}
+
 def get_headers(cookie, token):
     return {
         "Host": "mp.weixin.qq.com",
@@ -54,11 +206,661 @@ def get_headers(cookie, token):
         "Sec-Fetch-Dest": "empty",
     }
 
-def get_articles(fakeid, token, cookie, begin=0, count=5):
-    url = "https://mp.weixin.qq.com/cgi-bin/appmsgpublish"
-    headers = get_headers(cookie, token)
-    
-    params = {
+class Metrics:
+    """
+    进程内指标：计数器、仪表和各阶段耗时直方图
+    - inc(name, **labels): 计数器，如 articles_total{result="saved"}
+    - set_gauge(name, value): 仪表，记录当前值，如 api_rate_per_second
+    - timer(stage) / observe(stage, seconds): 阶段耗时，如 list_fetch、page_fetch、convert、write
+    可导出为 Prometheus 文本格式，或每轮追加一行到 JSON Lines 文件
+    """
+
+    PREFIX = "wechat_crawler_"
+    BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counters = {}
+        self.gauges = {}
+        self.histograms = {}
+
+    def inc(self, name, value=1, **labels):
+        key = (name, tuple(sorted((k, str(v)) for k, v in labels.items())))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def set_gauge(self, name, value):
+        with self.lock:
+            self.gauges[name] = value
+
+    def observe(self, stage, seconds):
+        with self.lock:
+            hist = self.histograms.get(stage)
+            if hist is None:
+                hist = self.histograms[stage] = {"buckets": [0] * len(self.BUCKETS), "sum": 0.0, "count": 0}
+            for i, bound in enumerate(self.BUCKETS):
+                if seconds <= bound:
+                    hist["buckets"][i] += 1
+            hist["sum"] += seconds
+            hist["count"] += 1
+
+    @contextlib.contextmanager
+    def timer(self, stage):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - start)
+
+    def snapshot(self):
+        """返回可 JSON 序列化的当前指标"""
+        with self.lock:
+            counters = {}
+            for (name, labels), value in sorted(self.counters.items()):
+                label_text = ",".join(f"{k}={v}" for k, v in labels)
+                counters[f"{name}{{{label_text}}}" if labels else name] = value
+            stages = {stage: {"count": h["count"], "sum_s": round(h["sum"], 6),
+                              "mean_ms": round(h["sum"] / h["count"] * 1000, 3) if h["count"] else 0.0}
+                      for stage, h in self.histograms.items()}
+            gauges = dict(sorted(self.gauges.items()))
+        return {"time": int(time.time()), "counters": counters, "gauges": gauges, "stages": stages}
+
+    def to_prometheus(self):
+        """Prometheus 文本格式（text/plain; version=0.0.4）"""
+        lines = []
+        with self.lock:
+            names = sorted({name for name, _ in self.counters})
+            for name in names:
+                lines.append(f"# TYPE {self.PREFIX}{name} counter")
+                for (key_name, labels), value in sorted(self.counters.items()):
+                    if key_name != name:
+                        continue
+                    label_text = ",".join(f'{k}="{v}"' for k, v in labels)
+                    lines.append(f"{self.PREFIX}{name}{{{label_text}}} {value}" if labels
+                                 else f"{self.PREFIX}{name} {value}")
+            for name, value in sorted(self.gauges.items()):
+                lines.append(f"# TYPE {self.PREFIX}{name} gauge")
+                lines.append(f"{self.PREFIX}{name} {value}")
+            if self.histograms:
+                metric = f"{self.PREFIX}stage_seconds"
+                lines.append(f"# TYPE {metric} histogram")
+                for stage, hist in sorted(self.histograms.items()):
+                    for bound, count in zip(self.BUCKETS, hist["buckets"]):
+                        lines.append(f'{metric}_bucket{{stage="{stage}",le="{bound}"}} {count}')
+                    lines.append(f'{metric}_bucket{{stage="{stage}",le="+Inf"}} {hist["count"]}')
+                    lines.append(f'{metric}_sum{{stage="{stage}"}} {hist["sum"]:.6f}')
+                    lines.append(f'{metric}_count{{stage="{stage}"}} {hist["count"]}')
+        return "\n".join(lines) + "\n"
+
+    def write_jsonl(self, path):
+        with open(path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(self.snapshot(), ensure_ascii=False) + "\n")
+
+metrics = Metrics()
+
+def start_metrics_server(port, host="127.0.0.1"):
+    """在后台线程提供 Prometheus 抓取端点 http://host:port/metrics"""
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] not in ("/", "/metrics"):
+                self.send_error(404)
+                return
+            body = metrics.to_prometheus().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    print(f"指标端点: http://{host}:{server.server_port}/metrics")
+    return server
+
+class CycleProfiler:
+    """
+    用 cProfile 采集一轮检查的耗时，包括线程池中的工作线程，结果写入 .prof 文件（可用 snakeviz / pstats 查看）
+    - Python 3.12 之前 cProfile 只分析启用它的线程，每个新线程单独一个 Profile，结束后合并
+    - Python 3.12 起 cProfile 基于 sys.monitoring，一个 Profile 覆盖所有线程，且同时只能启用一个
+    """
+
+    PER_THREAD = sys.version_info < (3, 12)
+
+    def __init__(self):
+        self.profiles = []
+        self.lock = threading.Lock()
+
+    def _start_thread_profile(self, *args):
+        profile = cProfile.Profile()
+        with self.lock:
+            self.profiles.append(profile)
+        profile.enable()
+
+    def __enter__(self):
+        if self.PER_THREAD:
+            threading.setprofile(self._start_thread_profile)
+        self._start_thread_profile()
+        return self
+
+    def __exit__(self, *exc):
+        if self.PER_THREAD:
+            threading.setprofile(None)
+        for profile in self.profiles:
+            profile.disable()
+
+    def dump(self, path, top=20):
+        stats = pstats.Stats(self.profiles[0])
+        for profile in self.profiles[1:]:
+            stats.add(profile)
+        stats.dump_stats(path)
+        print(f"性能分析结果已保存: {path}")
+        stats.sort_stats("cumulative").print_stats(top)
+
+def get_session(pool_size=DEFAULT_FETCH_WORKERS):
+    """
+    返回全局共享的 requests.Session
+    所有请求复用同一个连接池，避免每次请求都重新进行 TCP+TLS 握手
+    """
+    global _session, _session_pool_size
+    with _session_lock:
+        if _session is None:
+            _session = requests.Session()
+        if pool_size > _session_pool_size:
+            adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+            _session.mount("https://", adapter)
+            _session.mount("http://", adapter)
+            _session_pool_size = pool_size
+        return _session
+
+def host_slot(url, limit=None):
+    """
+    返回目标主机的并发信号量，限制同一主机同时进行的请求数
+    limit 为空时使用 save_articles 配置的 per_host_concurrency
+    """
+    host = urlparse(url).netloc
+    limit = max(1, limit or _per_host_limit)
+    with _session_lock:
+        slot = _host_slots.get(host)
+        if slot is None or slot[0] != limit:
+            slot = (limit, threading.BoundedSemaphore(limit))
+            _host_slots[host] = slot
+        return slot[1]
+
+class RateLimiter:
+    """
+    appmsgpublish 接口的自适应令牌桶限速器，所有列表页请求共享
+    - 请求成功：速率按 increase 缓慢上升，直到 max_rate
+    - 触发频率限制：速率减半，并按指数退避暂停所有请求
+    请求、限流、重试次数以及当前速率和实际每秒请求数同时发布到 metrics
+    """
+
+    def __init__(self, rate=0.33, min_rate=0.05, max_rate=2.0, burst=1,
+                 increase=0.02, base_backoff=30, max_backoff=900):
+        self.rate = rate
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.burst = burst
+        self.increase = increase
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self.consecutive_throttles = 0
+        self.started = None
+        self.requests = 0
+        self.throttles = 0
+        self.retries = 0
+        self.lock = threading.Lock()
+
+    def try_acquire(self):
+        """尝试拿一个令牌，成功返回 0，否则返回需要等待的秒数"""
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if now >= self.paused_until and self.tokens >= 1:
+                self.tokens -= 1
+                self.requests += 1
+                if self.started is None:
+                    self.started = now
+                metrics.inc("api_requests_total")
+                self._publish_gauges(now)
+                return 0
+            return max(self.paused_until - now, (1 - self.tokens) / self.rate)
+
+    def acquire(self):
+        """阻塞直到拿到一个令牌"""
+        while True:
+            wait = self.try_acquire()
+            if not wait:
+                return
+            time.sleep(wait)
+
+    async def acquire_async(self):
+        """异步引擎使用：等待令牌时不占用线程"""
+        while True:
+            wait = self.try_acquire()
+            if not wait:
+                return
+            await asyncio.sleep(wait)
+
+    def on_success(self):
+        with self.lock:
+            self.consecutive_throttles = 0
+            self.rate = min(self.max_rate, self.rate + self.increase)
+            self._publish_gauges(time.monotonic())
+
+    def on_throttle(self):
+        """记录一次频率限制，返回本次退避秒数"""
+        with self.lock:
+            self.throttles += 1
+            self.consecutive_throttles += 1
+            self.rate = max(self.min_rate, self.rate / 2)
+            backoff = min(self.max_backoff, self.base_backoff * 2 ** (self.consecutive_throttles - 1))
+            backoff *= random.uniform(0.8, 1.2)
+            self.paused_until = max(self.paused_until, time.monotonic() + backoff)
+            self.tokens = 0
+            metrics.inc("api_throttles_total")
+            self._publish_gauges(time.monotonic())
+            return backoff
+
+    def on_retry(self):
+        with self.lock:
+            self.retries += 1
+        metrics.inc("api_retries_total")
+
+    def _effective_rps(self, now):
+        elapsed = now - self.started if self.started else 0
+        return round(self.requests / elapsed, 3) if elapsed > 0 else 0.0
+
+    def _publish_gauges(self, now):
+        """调用方持有 self.lock"""
+        metrics.set_gauge("api_rate_per_second", round(self.rate, 3))
+        metrics.set_gauge("api_effective_rps", self._effective_rps(now))
+
+    def stats(self):
+        with self.lock:
+            return {
+                "requests": self.requests,
+                "throttles": self.throttles,
+                "retries": self.retries,
+                "rate": round(self.rate, 3),
+                "effective_rps": self._effective_rps(time.monotonic()),
+            }
+
+def get_rate_limiter():
+    """返回全局共享的列表页限速器，参数从 config.json 读取"""
+    global _rate_limiter
+    with _session_lock:
+        if _rate_limiter is None:
+            config = get_config()
+            _rate_limiter = RateLimiter(
+                rate=config.get("api_rate_per_second", 0.33),
+                min_rate=config.get("api_min_rate_per_second", 0.05),
+                max_rate=config.get("api_max_rate_per_second", 2.0),
+                base_backoff=config.get("api_backoff_seconds", 30),
+                max_backoff=config.get("api_max_backoff_seconds", 900),
+            )
+        return _rate_limiter
+
+class CacheMiss(Exception):
+    """离线模式下缓存中没有对应的响应"""
+
+class MissingContent(Exception):
+    """
+    文章页面中没有正文（js_content），通常是验证页、"环境异常"提示或已删除文章
+    按下载失败处理（稍后重试），不能当作内容过小永久跳过
+    """
+
+class CachedResponse:
+    """从磁盘缓存读出的响应，提供与 requests.Response 相同的常用接口"""
+
+    def __init__(self, url, status_code, headers, content):
+        self.url = url
+        self.status_code = status_code
+        self.headers = requests.structures.CaseInsensitiveDict(headers)
+        self.content = content
+        self.encoding = "utf-8"
+
+    @property
+    def text(self):
+        return self.content.decode(self.encoding or "utf-8", errors="replace")
+
+    def json(self):
+        return decode_json(self.content)
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.HTTPError(f"{self.status_code} (cached) for url: {self.url}")
+
+class HttpCache:
+    """
+    磁盘 HTTP 响应缓存，按 URL + 参数（不含 token）建键
+    - 在 TTL 内直接返回缓存；过期后若有 ETag/Last-Modified 则发条件请求，304 时沿用缓存
+    - 同一个键同时只会有一个请求在进行，其他线程等待；结果已写入缓存或经 304 确认时共享，
+      否则（如频率限制等不可缓存的响应）等待的线程各自重新请求
+    - 总大小超过上限时按最近使用时间淘汰
+    - offline=True 时只读缓存，未命中抛出 CacheMiss，可离线重放一次运行
+    """
+
+    IGNORED_PARAMS = {"token"}
+
+    def __init__(self, directory, max_bytes, offline=False):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.offline = offline
+        self.lock = threading.Lock()
+        self.inflight = {}
+        self.hits = 0
+        self.misses = 0
+        self.revalidated = 0
+        os.makedirs(directory, exist_ok=True)
+        self.total_bytes = sum(
+            os.path.getsize(os.path.join(directory, name)) for name in os.listdir(directory))
+
+    def key(self, url, params=None):
+        items = sorted((k, str(v)) for k, v in (params or {}).items() if k not in self.IGNORED_PARAMS)
+        return hashlib.sha1(f"{url}?{urlencode(items)}".encode("utf-8")).hexdigest()
+
+    def _paths(self, key):
+        base = os.path.join(self.directory, key)
+        return base + ".json", base + ".body"
+
+    def _load(self, key):
+        meta_path, body_path = self._paths(key)
+        try:
+            with open(meta_path, "r", encoding="utf-8") as f:
+                meta = json.load(f)
+            with open(body_path, "rb") as f:
+                body = f.read()
+        except (OSError, ValueError):
+            return None, None
+        return meta, body
+
+    def _store(self, key, url, response):
+        meta_path, body_path = self._paths(key)
+        meta = {
+            "url": url,
+            "status_code": response.status_code,
+            "headers": {k.lower(): v for k, v in response.headers.items()
+                        if k.lower() in ("content-type", "etag", "last-modified")},
+            "stored_at": time.time(),
+        }
+        old_size = sum(os.path.getsize(p) for p in (meta_path, body_path) if os.path.exists(p))
+        for path, data in ((body_path, response.content),
+                           (meta_path, json.dumps(meta, ensure_ascii=False).encode("utf-8"))):
+            # 多个分片进程可能共用缓存目录，临时文件名带上进程号
+            tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        with self.lock:
+            self.total_bytes += os.path.getsize(meta_path) + os.path.getsize(body_path) - old_size
+            over = self.total_bytes > self.max_bytes
+        if over:
+            self.evict()
+
+    def is_fresh(self, url, params, ttl):
+        """有未过期的缓存（或离线模式）时返回 True，此时不会发出网络请求，不需要等待限速"""
+        if self.offline:
+            return True
+        try:
+            with open(self._paths(self.key(url, params))[0], "r", encoding="utf-8") as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            return False
+        return time.time() - meta["stored_at"] < ttl
+
+    def evict(self):
+        """按最近使用时间淘汰，直到总大小降到上限的 90%"""
+        entries = []
+        for name in os.listdir(self.directory):
+            if name.endswith(".body"):
+                path = os.path.join(self.directory, name)
+                try:
+                    entries.append((os.path.getmtime(path), name[:-5]))
+                except OSError:
+                    pass
+        entries.sort()
+        for _, key in entries:
+            with self.lock:
+                if self.total_bytes <= self.max_bytes * 0.9:
+                    return
+            freed = 0
+            for path in self._paths(key):
+                try:
+                    freed += os.path.getsize(path)
+                    os.remove(path)
+                except OSError:
+                    pass
+            with self.lock:
+                self.total_bytes -= freed
+
+    def get(self, url, params, ttl, fetch, cacheable=None):
+        """
+        返回 (响应, 是否来自缓存)
+        fetch(extra_headers) 负责真正发出请求；cacheable(response) 为 False 的响应不写入缓存
+        """
+        key = self.key(url, params)
+        with self.lock:
+            waiter = self.inflight.get(key)
+            if waiter is None:
+                self.inflight[key] = waiter = {"event": threading.Event(), "result": None}
+                owner = True
+            else:
+                owner = False
+        if not owner:
+            waiter["event"].wait()
+            if waiter["result"] is not None:
+                with self.lock:
+                    self.hits += 1
+                return waiter["result"], True
+            return self.get(url, params, ttl, fetch, cacheable)
+
+        try:
+            response, from_cache, shared = self._get(key, url, ttl, fetch, cacheable)
+            if shared:
+                waiter["result"] = response
+            return response, from_cache
+        finally:
+            with self.lock:
+                del self.inflight[key]
+            waiter["event"].set()
+
+    def _get(self, key, url, ttl, fetch, cacheable):
+        """返回 (响应, 是否来自缓存, 能否共享给等待的线程)"""
+        meta, body = self._load(key)
+        if meta is not None:
+            cached = CachedResponse(url, meta["status_code"], meta["headers"], body)
+            if self.offline or time.time() - meta["stored_at"] < ttl:
+                os.utime(self._paths(key)[1])
+                with self.lock:
+                    self.hits += 1
+                return cached, True, True
+        if self.offline:
+            raise CacheMiss(url)
+
+        extra_headers = {}
+        if meta is not None:
+            if meta["headers"].get("etag"):
+                extra_headers["If-None-Match"] = meta["headers"]["etag"]
+            if meta["headers"].get("last-modified"):
+                extra_headers["If-Modified-Since"] = meta["headers"]["last-modified"]
+        response = fetch(extra_headers)
+        if response.status_code == 304 and meta is not None:
+            meta["stored_at"] = time.time()
+            with open(self._paths(key)[0], "w", encoding="utf-8") as f:
+                json.dump(meta, f, ensure_ascii=False)
+            with self.lock:
+                self.revalidated += 1
+            return cached, True, True
+        with self.lock:
+            self.misses += 1
+        if response.status_code == 200 and (cacheable is None or cacheable(response)):
+            self._store(key, url, response)
+            return response, False, True
+        return response, False, False
+
+def get_http_cache():
+    """返回全局 HTTP 缓存，未开启 http_cache 时返回 None"""
+    global _http_cache
+    config = get_config()
+    if not config.get("http_cache") and not config.get("http_cache_offline"):
+        return None
+    with _session_lock:
+        if _http_cache is None:
+            _http_cache = HttpCache(HTTP_CACHE_DIR,
+                                    config.get("http_cache_max_mb", 500) * 1024 * 1024,
+                                    offline=config.get("http_cache_offline", False))
+        return _http_cache
+
+def cached_get(url, headers, params=None, ttl=0, cacheable=None, before_request=None):
+    """
+    经过 HTTP 缓存的 GET 请求，返回 (响应, 是否来自缓存)
+    before_request 在真正发出网络请求前调用（例如列表接口的限速）
+    """
+    def fetch(extra_headers):
+        if before_request:
+            before_request()
+        return get_session().get(url, headers={**headers, **extra_headers}, params=params, timeout=30)
+
+    cache = get_http_cache()
+    if cache is None:
+        return fetch({}), False
+    return cache.get(url, params, ttl, fetch, cacheable)
+
+def json_backend():
+    """
+    列表接口使用的 JSON 解码方式，由 json_decoder 配置（auto / msgspec / orjson / json）
+    auto 或指定的库未安装时依次使用 msgspec、orjson、标准库 json
+    """
+    name = get_config().get("json_decoder", "auto")
+    if name == "json" or (name == "msgspec" and msgspec is not None) or (name == "orjson" and orjson is not None):
+        return name
+    return "msgspec" if msgspec is not None else "orjson" if orjson is not None else "json"
+
+def decode_json(data, backend=None):
+    """解码 JSON（bytes 或 str），解码失败时抛出 ValueError"""
+    backend = backend or json_backend()
+    if backend == "msgspec":
+        return msgspec.json.decode(data)
+    if backend == "orjson":
+        return orjson.loads(data)
+    return json.loads(data)
+
+def is_cacheable_list_response(response):
+    """频率限制等错误响应不能缓存"""
+    try:
+        return decode_json(response.content).get("base_resp", {}).get("ret", 0) == 0
+    except ValueError:
+        return False
+
+class ArticleRecord:
+    """
+    列表接口中的一篇文章，只保存用到的字段
+    支持 article.get("link") 和 article["link"]，与原来的字典用法相同
+    """
+
+    __slots__ = ("title", "link", "create_time", "msgid", "digest", "author")
+
+    def __init__(self, title, link, create_time=0, msgid=0, digest="", author=""):
+        self.title = title
+        self.link = link
+        self.create_time = create_time
+        self.msgid = msgid
+        self.digest = digest
+        self.author = author
+
+    def get(self, key, default=None):
+        return getattr(self, key) if key in self.__slots__ else default
+
+    def __getitem__(self, key):
+        if key not in self.__slots__:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def __repr__(self):
+        return f"ArticleRecord(title={self.title!r}, link={self.link!r}, create_time={self.create_time!r})"
+
+if msgspec is not None:
+    # publish_page / publish_info 中只解码用到的字段，其余字段解析时直接跳过
+    class _SentInfo(msgspec.Struct):
+        time: int = 0
+
+    class _AppMsg(msgspec.Struct):
+        title: Optional[str] = None
+        content_url: Optional[str] = None
+        digest: Optional[str] = ""
+        author: Optional[str] = ""
+
+    class _PublishInfo(msgspec.Struct):
+        msgid: Union[int, str] = 0
+        sent_info: Optional[_SentInfo] = None
+        appmsg_info: List[_AppMsg] = []
+
+    class _PublishItem(msgspec.Struct):
+        publish_info: str = "{}"
+
+    class _PublishPage(msgspec.Struct):
+        total_count: int = 0
+        publish_list: List[_PublishItem] = []
+
+    _PUBLISH_PAGE_DECODER = msgspec.json.Decoder(_PublishPage)
+    _PUBLISH_INFO_DECODER = msgspec.json.Decoder(_PublishInfo)
+
+def parse_publish_page_typed(publish_page):
+    """用 msgspec 按字段类型解码 publish_page，字段类型与预期不同时抛出 msgspec.ValidationError"""
+    page = _PUBLISH_PAGE_DECODER.decode(publish_page)
+    articles = []
+    for publish_item in page.publish_list:
+        publish_info = _PUBLISH_INFO_DECODER.decode(publish_item.publish_info)
+        create_time = publish_info.sent_info.time if publish_info.sent_info else 0
+        for appmsg in publish_info.appmsg_info:
+            articles.append(ArticleRecord(appmsg.title, appmsg.content_url, create_time, publish_info.msgid,
+                                          appmsg.digest, appmsg.author))
+    return articles, page.total_count
+
+def parse_publish_page(data, backend=None):
+    """
+    解析 appmsgpublish 接口返回的数据
+    返回 (文章列表, 文章总数)
+    """
+    backend = backend or json_backend()
+    if backend == "msgspec":
+        try:
+            return parse_publish_page_typed(data["publish_page"])
+        except msgspec.ValidationError:
+            # 接口字段类型变化时按通用方式解析
+            pass
+
+    # 解码函数只选一次，避免每个 publish_info 都经过 decode_json 分发
+    loads = msgspec.json.decode if backend == "msgspec" else orjson.loads if backend == "orjson" else json.loads
+
+    # publish_page 是一个 JSON 字符串，需要再次解析
+    publish_page = loads(data["publish_page"])
+    publish_list = publish_page.get("publish_list", [])
+    total_count = publish_page.get("total_count", 0)
+
+    # 从 publish_list 中提取所有文章
+    articles = []
+    append = articles.append
+    for publish_item in publish_list:
+        publish_info = loads(publish_item.get("publish_info", "{}"))
+        create_time = publish_info.get("sent_info", {}).get("time", 0)
+        msgid = publish_info.get("msgid", 0)
+        for appmsg in publish_info.get("appmsg_info", ()):
+            get = appmsg.get
+            append(ArticleRecord(get("title"), get("content_url"), create_time, msgid,
+                                 get("digest", ""), get("author", "")))
+    return articles, total_count
+
+def list_params(fakeid, token, begin, count):
+    return {
         "sub": "list",
         "begin": str(begin),
         "count": str(count),
@@ -68,44 +870,74 @@ def get_articles(fakeid, token, cookie, begin=0, count=5):
         "f": "json",
         "ajax": "1"
     }
+
+def check_list_response(data, limiter, from_cache):
+    """
+    处理列表接口返回的 JSON（get_articles 和异步引擎共用）
+    返回 (文章列表, 文章总数, 错误码, 是否重试)
+    """
+    ret = data.get("base_resp", {}).get("ret", 0)
+    if ret != 0:
+        metrics.inc("api_errors_total", ret=ret)
+    if ret == FREQ_CONTROL_RET:
+        backoff = limiter.on_throttle()
+        print(f"  [Throttle] 触发频率限制，{backoff:.0f} 秒后重试")
+        return [], 0, ret, True
+    if ret != 0:
+        print(f"API Error: {data['base_resp']}")
+        return [], 0, ret, False
+
+    if not from_cache:
+        limiter.on_success()
+    if "publish_page" in data:
+        with metrics.timer("list_parse"):
+            articles, total_count = parse_publish_page(data)
+        return articles, total_count, None, False
+    else:
+        print("未找到 publish_page 字段")
+        return [], 0, None, False
+
+def get_articles(fakeid, token, cookie, begin=0, count=5):
+    """
+    获取公众号文章列表的一页
+    返回 (文章列表, 文章总数, 错误码)，成功时错误码为 None
+    频率限制和网络错误会自动退避重试，重试耗尽后返回对应的错误码
+    """
+    url = f"{MP_BASE_URL}/cgi-bin/appmsgpublish"
+    headers = get_headers(cookie, token)
+    limiter = get_rate_limiter()
+    max_retries = get_config().get("api_max_retries", 5)
+    list_ttl = get_config().get("http_cache_list_ttl_seconds", 300)
+    params = list_params(fakeid, token, begin, count)
     
-    try:
-        response = requests.get(url, headers=headers, params=params)
-        response.raise_for_status()
-        data = response.json()
-        
-        if "base_resp" in data and data["base_resp"]["ret"] != 0:
-            print(f"API Error: {data['base_resp']}")
-            return [], 0, None
-        
-        # publish_page 是一个 JSON 字符串，需要再次解析
-        if "publish_page" in data:
-            publish_page = json.loads(data["publish_page"])
-            publish_list = publish_page.get("publish_list", [])
-            total_count = publish_page.get("total_count", 0)
-            
-            # 从 publish_list 中提取所有文章
-            articles = []
-            for publish_item in publish_list:
-                publish_info = json.loads(publish_item.get("publish_info", "{}"))
-                appmsg_info = publish_info.get("appmsg_info", [])
-                for appmsg in appmsg_info:
-                    articles.append({
-                        "title": appmsg.get("title"),
-                        "link": appmsg.get("content_url"),
-                        "create_time": publish_info.get("sent_info", {}).get("time", 0),
-                        "digest": appmsg.get("digest", ""),
-                        "author": appmsg.get("author", "")
-                    })
-            
-            return articles, total_count, None
-        else:
-            print("未找到 publish_page 字段")
-            return [], 0, None
-            
-    except Exception as e:
-        print(f"请求失败: {e}")
-        return [], 0, None
+    error = None
+    for attempt in range(max_retries + 1):
+        if attempt:
+            limiter.on_retry()
+        try:
+            with metrics.timer("list_fetch"):
+                response, from_cache = cached_get(url, headers, params, ttl=list_ttl,
+                                                  cacheable=is_cacheable_list_response,
+                                                  before_request=limiter.acquire)
+                response.raise_for_status()
+                data = decode_json(response.content)
+        except CacheMiss:
+            print(f"  [Cache] 离线模式下缓存未命中: {fakeid} begin={begin}")
+            metrics.inc("api_errors_total", ret="cache_miss")
+            return [], 0, "cache_miss"
+        except Exception as e:
+            print(f"请求失败: {e}")
+            metrics.inc("api_errors_total", ret="network")
+            error = "network"
+            time.sleep(min(60, 2 ** attempt))
+            continue
+
+        articles, total_count, error, retry = check_list_response(data, limiter, from_cache)
+        if not retry:
+            return articles, total_count, error
+
+    print(f"  重试 {max_retries} 次后仍然失败: {error}")
+    return [], 0, error
 
 def is_valid_article_link(link):
     """
@@ -119,13 +951,365 @@ def is_valid_article_link(link):
         return False
     return True
 
+def canonical_link(link):
+    """
+    文章链接的规范形式，同一篇文章带不同参数（chksm、scene、sn 等）的链接得到相同结果
+    - /s?__biz=...&mid=...&idx=...  ->  __biz/mid/idx
+    - /s/短链接                     ->  /s/短链接
+    - 其他链接去掉 # 之后的部分
+    """
+    if not link:
+        return link
+    parsed = urlparse(html.unescape(link))
+    query = parse_qs(parsed.query)
+    biz = query.get("__biz", [None])[0]
+    mid = query.get("mid", query.get("appmsgid", [None]))[0]
+    if biz and mid:
+        return f"{biz}/{mid}/{query.get('idx', ['1'])[0]}"
+    if parsed.path.startswith("/s/"):
+        return parsed.path
+    return link.split("#", 1)[0]
+
+_JS_CONTENT_RE = re.compile(r'<div[^>]*\bid="js_content"[^>]*>')
+_DIV_RE = re.compile(r"<(/?)div\b", re.IGNORECASE)
+_IMG_SRC_RE = re.compile(r'<img[^>]*?\bdata-src="([^"]+)"', re.IGNORECASE)
+_STRIP_TAG_RE = re.compile(r"<[^>]+>")
+
+def js_content_span(content_html):
+    """返回 js_content 开始标签的位置、正文开始和结束位置，页面中没有 js_content 时返回 None"""
+    start = _JS_CONTENT_RE.search(content_html)
+    if not start:
+        return None
+    depth = 1
+    end = len(content_html)
+    for match in _DIV_RE.finditer(content_html, start.end()):
+        depth += -1 if match.group(1) else 1
+        if depth == 0:
+            end = match.start()
+            break
+    return start.start(), start.end(), end
+
+def js_content_fragment(content_html):
+    """截取 js_content 元素（含开始和结束标签），转换结果与整个页面相同"""
+    span = js_content_span(content_html)
+    if span is None:
+        return None
+    return content_html[span[0]:span[2]] + "</div>"
+
+def content_fingerprint(content_html):
+    """
+    正文指纹：js_content 中的文字（去掉标签、合并空白）和图片地址的 sha256
+    用于在转换前发现被多个公众号转载、或通过不同链接重复抓取的同一篇文章
+    页面中没有 js_content 或正文为空时返回 None
+    """
+    span = js_content_span(content_html)
+    if span is None:
+        return None
+    content = content_html[span[1]:span[2]]
+    text = _WHITESPACE_RE.sub(" ", html.unescape(_STRIP_TAG_RE.sub(" ", content))).strip()
+    images = _IMG_SRC_RE.findall(content)
+    if not text and not images:
+        return None
+    digest = hashlib.sha256(text.encode("utf-8"))
+    for src in images:
+        digest.update(b"\0" + html.unescape(src).encode("utf-8"))
+    return digest.hexdigest()
+
 def clean_filename(title):
     # 去除非法字符
     return re.sub(r'[\\/*?:"<>|]', "", title).strip()
 
-def html_to_markdown(html):
+_WHITESPACE_RE = re.compile(r"\s+")
+_NICKNAME_RE = re.compile(r'var nickname = "([^"]+)"')
+_PROFILE_NICKNAME_RE = re.compile(r'class="profile_meta_value">([^<]+)<')
+_MD_IMAGE_RE = re.compile(r"!\[\]\((https?://[^)\s]+)\)")
+_TAG_RE = re.compile(r"""<(/?)([a-zA-Z][-a-zA-Z0-9:]*)((?:[^>"']|"[^"]*"|'[^']*')*)>""")
+_ATTR_RE = re.compile(r"""([^\s=/>]+)(?:\s*=\s*(?:"([^"]*)"|'([^']*)'|([^\s>]+)))?""")
+_RAW_TEXT_END = {
+    "script": re.compile(r"</script\s*>", re.IGNORECASE),
+    "style": re.compile(r"</style\s*>", re.IGNORECASE),
+}
+_BLOCK_TAGS = {"p", "div", "section", "blockquote", "ul", "ol", "table", "tr", "hr", "figure", "figcaption"}
+_SKIP_TAGS = {"head", "script", "style", "noscript", "template"}
+_VOID_TAGS = {"img", "br", "hr", "input", "meta", "link", "source", "wbr"}
+
+class MarkdownConverter:
+    """
+    单遍 HTML 转 Markdown 转换器
+    用预编译的正则逐个扫描标签（状态机），实体由 html.unescape 完整解码
+    - write: 输出回调，为空时结果缓存在内存中，通过 getvalue() 取出
+    - root_id: 只转换 id 为该值的元素（如 js_content），按标签嵌套深度找到对应的结束标签
+    支持多次 feed()，可用于边下载边转换
+    """
+
+    def __init__(self, write=None, root_id=None):
+        self._buf = ""
+        self._raw_end = None
+        self._parts = []
+        self._write = write or self._parts.append
+        self.root_id = root_id
+        self._root_tag = None
+        self._root_depth = 0
+        self.root_found = False
+        self._skip = 0
+        self._pre = 0
+        self._started = False
+        self._pending_newlines = 0
+        self._inline = []
+        self._lists = []
+
+    # --- 扫描 ---
+
+    def feed(self, data):
+        self._buf += data
+        self._scan(final=False)
+
+    def _scan(self, final):
+        """
+        扫描缓冲区中完整的标签和文本，不完整的结尾留到下次 feed
+        script/style 内容整体跳过，不做标签解析
+        """
+        buf = self._buf
+        pos = 0
+        end = len(buf)
+        while pos < end:
+            if self._raw_end is not None:
+                m = self._raw_end.search(buf, pos)
+                if m is None:
+                    # 只保留可能被截断的结束标签
+                    pos = end if final else max(pos, end - 16)
+                    break
+                pos = m.end()
+                self._raw_end = None
+                continue
+
+            lt = buf.find("<", pos)
+            if lt == -1:
+                if final:
+                    self.handle_data(html.unescape(buf[pos:]))
+                    pos = end
+                break
+            if lt > pos:
+                text = buf[pos:lt]
+                self.handle_data(html.unescape(text) if "&" in text else text)
+                pos = lt
+
+            if buf.startswith("<!--", lt):
+                close = buf.find("-->", lt + 4)
+                if close == -1:
+                    if final:
+                        pos = end
+                    break
+                pos = close + 3
+                continue
+            m = _TAG_RE.match(buf, lt)
+            if m is None:
+                gt = buf.find(">", lt)
+                if gt == -1 and not final:
+                    break
+                if buf.startswith(("<!", "<?"), lt) and gt != -1:
+                    pos = gt + 1
+                else:
+                    # 不成对的 "<" 按普通文本处理
+                    self.handle_data("<")
+                    pos = lt + 1
+                continue
+
+            pos = m.end()
+            closing, tag, attr_text = m.groups()
+            tag = tag.lower()
+            if closing:
+                self.handle_endtag(tag)
+                continue
+            attrs = []
+            if tag == "img" or (self.root_id is not None and not self.root_found and "id" in attr_text):
+                attrs = [(k.lower(), html.unescape(v1 or v2 or v3 or ""))
+                         for k, v1, v2, v3 in _ATTR_RE.findall(attr_text)]
+            if tag in _RAW_TEXT_END:
+                self._raw_end = _RAW_TEXT_END[tag]
+                continue
+            self.handle_starttag(tag, attrs)
+            if attr_text.endswith("/") and tag not in _VOID_TAGS:
+                self.handle_endtag(tag)
+        self._buf = buf[pos:]
+
+    # --- 输出 ---
+
+    def _block(self, newlines=2):
+        """请求一个块级分隔，实际换行推迟到下一段内容之前，避免首尾空行"""
+        if self._started:
+            self._pending_newlines = max(self._pending_newlines, newlines)
+
+    def _emit(self, text, inline_markers=True):
+        if self._pending_newlines:
+            self._write("\n" * self._pending_newlines)
+            self._pending_newlines = 0
+        if inline_markers:
+            for entry in self._inline:
+                if not entry[2]:
+                    self._write(entry[1])
+                    entry[2] = True
+        self._write(text)
+        self._started = True
+
+    def _open_inline(self, tag, marker, closing=None):
+        self._inline.append([tag, marker, False, marker if closing is None else closing])
+
+    def _close_inline(self, tag):
+        for i in range(len(self._inline) - 1, -1, -1):
+            if self._inline[i][0] == tag:
+                # 同时关闭未闭合的内层标签
+                for entry in reversed(self._inline[i:]):
+                    if entry[2] and entry[3]:
+                        self._write(entry[3])
+                del self._inline[i:]
+                return
+
+    # --- 标签处理 ---
+
+    def _outside_root(self, tag, attrs=None, closing=False):
+        """root_id 模式下判断当前标签是否在目标元素之外，并维护嵌套深度"""
+        if self.root_id is None:
+            return False
+        if self._root_tag is None:
+            if not closing and not self.root_found and dict(attrs).get("id") == self.root_id:
+                self._root_tag = tag
+                self._root_depth = 1
+                self.root_found = True
+            return True
+        if tag == self._root_tag:
+            self._root_depth += -1 if closing else 1
+            if self._root_depth == 0:
+                self._root_tag = None
+                return True
+        return False
+
+    def handle_starttag(self, tag, attrs):
+        if self._outside_root(tag, attrs):
+            return
+        if tag == "body":
+            # 容错：未闭合的 <head> 不应吞掉正文
+            self._skip = 0
+            return
+        if tag in _SKIP_TAGS:
+            self._skip += 1
+            return
+        if self._skip:
+            return
+        if self._pre:
+            if tag == "br":
+                self._write("\n")
+            return
+
+        if tag == "img":
+            attrs = dict(attrs)
+            src = attrs.get("data-src") or attrs.get("src")
+            if src:
+                self._block(1)
+                self._emit(f"![]({src})", inline_markers=False)
+                self._block(1)
+        elif tag == "br":
+            if self._started:
+                self._pending_newlines = min(2, self._pending_newlines + 1)
+        elif tag == "pre":
+            self._block(2)
+            self._emit("```\n", inline_markers=False)
+            self._pre += 1
+        elif len(tag) == 2 and tag[0] == "h" and tag[1] in "123456":
+            self._block(2)
+            self._open_inline(tag, "#" * int(tag[1]) + " ", "")
+        elif tag == "li":
+            self._block(1)
+            depth = max(0, len(self._lists) - 1)
+            if self._lists and self._lists[-1][0] == "ol":
+                self._lists[-1][1] += 1
+                marker = f"{self._lists[-1][1]}. "
+            else:
+                marker = "- "
+            self._open_inline(tag, "  " * depth + marker, "")
+        elif tag in ("ul", "ol"):
+            self._block(1 if self._lists else 2)
+            self._lists.append([tag, 0])
+        elif tag in ("b", "strong"):
+            self._open_inline(tag, "**")
+        elif tag == "code":
+            self._open_inline(tag, "`")
+        elif tag in _BLOCK_TAGS:
+            self._block(2 if tag == "p" else 1)
+
+    def handle_endtag(self, tag):
+        if self._outside_root(tag, closing=True):
+            return
+        if tag in _SKIP_TAGS:
+            self._skip = max(0, self._skip - 1)
+            return
+        if self._skip:
+            return
+        if self._pre:
+            if tag == "pre":
+                self._pre -= 1
+                self._write("\n```")
+                self._block(2)
+            return
+
+        if tag in ("b", "strong", "code"):
+            self._close_inline(tag)
+        elif len(tag) == 2 and tag[0] == "h" and tag[1] in "123456":
+            self._close_inline(tag)
+            self._block(2)
+        elif tag == "li":
+            self._close_inline(tag)
+            self._block(1)
+        elif tag in ("ul", "ol"):
+            if self._lists:
+                self._lists.pop()
+            self._block(1 if self._lists else 2)
+        elif tag in _BLOCK_TAGS:
+            self._block(2 if tag == "p" else 1)
+
+    def handle_data(self, data):
+        if self._skip or (self.root_id is not None and self._root_tag is None):
+            return
+        if self._pre:
+            self._emit(data.replace("\xa0", " "), inline_markers=False)
+            return
+        text = _WHITESPACE_RE.sub(" ", data.replace("\xa0", " "))
+        if text == " " and (not self._started or self._pending_newlines):
+            return
+        if self._pending_newlines or not self._started:
+            text = text.lstrip()
+        if text:
+            self._emit(text)
+
+    def close(self):
+        self._scan(final=True)
+        for entry in reversed(self._inline):
+            if entry[2] and entry[3]:
+                self._write(entry[3])
+        self._inline = []
+        if self._pre:
+            self._write("\n```")
+            self._pre = 0
+
+    def getvalue(self):
+        return "".join(self._parts)
+
+def html_to_markdown(html, legacy=False, root_id=None):
+    """
+    HTML 转 Markdown
+    默认使用单遍解析的 MarkdownConverter；legacy=True 时使用旧版正则转换器
+    """
+    if legacy:
+        return html_to_markdown_legacy(html)
+    converter = MarkdownConverter(root_id=root_id)
+    converter.feed(html)
+    converter.close()
+    return converter.getvalue().strip()
+
+def html_to_markdown_legacy(html):
     """
     Simple Regex-based HTML to Markdown converter.
+    旧版多遍正则转换器，保留用于对比输出
     """
     # Remove style and script
     html = re.sub(r'<style.*?>.*?</style>', '', html, flags=re.DOTALL)
@@ -186,109 +1370,531 @@ def html_to_markdown(html):
     
     return html.strip()
 
-def save_url_to_md(article, headers, account_name=None):
-    url = article.get("link")
-    title = article.get("title")
-    digest = article.get("digest", "")
-    
-    # Try to find date - create_time is timestamp
-    try:
-        create_time = article.get("create_time")
-        date_str = time.strftime("%Y-%m-%d", time.localtime(create_time))
-    except:
-        date_str = "Unknown"
+def markdown_header(title, date_str, url, folder_name, digest=""):
+    lines = [f"# {title}", "", f"**Date:** {date_str}", f"**Link:** {url}", f"**Account:** {folder_name}"]
+    if digest:
+        lines.append(f"**Summary:** {digest}")
+    return "\n".join(lines) + "\n\n"
 
-    if not url:
-        return
+def article_path(folder_name, title, date_str):
+    """返回文章的保存路径，并确保公众号目录存在"""
+    # Create account subdirectory
+    account_dir = os.path.join(ARTICLES_BASE_DIR, clean_filename(folder_name))
+    os.makedirs(account_dir, exist_ok=True)
+    return os.path.join(account_dir, f"{date_str}_{clean_filename(title)}.md")
 
-    try:
-        # Fetch article content
-        resp = requests.get(url, headers=headers)
-        resp.encoding = "utf-8"
-        content_html = resp.text
-        
-        # Use provided account name or try to extract from HTML
-        folder_name = account_name if account_name else "Unknown_Account"
-        
-        if folder_name == "Unknown_Account":
-            # Try to extract from HTML var nickname
-            nick_match = re.search(r'var nickname = "([^"]+)"', content_html)
-            if nick_match:
-                folder_name = nick_match.group(1)
-            elif "profile_meta_nickname" in content_html:
-                nick_match_2 = re.search(r'class="profile_meta_value">([^<]+)<', content_html)
-                if nick_match_2:
-                    folder_name = nick_match_2.group(1).strip()
-
-        # Create base directory if not exists
-        if not os.path.exists(ARTICLES_BASE_DIR):
-            os.makedirs(ARTICLES_BASE_DIR)
-        
-        # Create account subdirectory
-        safe_account_folder = clean_filename(folder_name)
-        account_dir = os.path.join(ARTICLES_BASE_DIR, safe_account_folder)
-        if not os.path.exists(account_dir):
-            os.makedirs(account_dir)
-            
-        safe_title = clean_filename(title)
-        filename = os.path.join(account_dir, f"{date_str}_{safe_title}.md")
-        
-        if os.path.exists(filename):
-            print(f"  [Jump] File exists: {filename}")
-            return
+def find_nickname(content_html):
+    """从文章页面中提取公众号名称"""
+    nick_match = _NICKNAME_RE.search(content_html)
+    if nick_match:
+        return nick_match.group(1)
+    if "profile_meta_nickname" in content_html:
+        nick_match_2 = _PROFILE_NICKNAME_RE.search(content_html)
+        if nick_match_2:
+            return nick_match_2.group(1).strip()
+    return None
 
-        # Convert to Markdown
-        # Only extract the main content container: id="js_content"
-        main_content = ""
-        content_match = re.search(r'<div[^>]*id="js_content"[^>]*>(.*?)</div>', content_html, re.DOTALL)
-        
-        if content_match:
-             main_content = content_match.group(1)
-        else:
-             # Fallback: parsing might be complex, use whole response body
-             main_content = re.search(r'<body[^>]*>(.*?)</body>', content_html, re.DOTALL).group(1) if re.search(r'<body', content_html) else content_html
+def install_article_file(part_path, filename, config, data=None):
+    """
+    把临时文件改名为正式文件（开启 mirror_images 时先镜像图片）并加入检索索引，不更新文章状态
+    data 为已写入临时文件的内容时不再读取文件内容
+    """
+    if config.get("mirror_images"):
+        # 图片链接改写为本地路径后需要重新读取内容
+        mirror_images(part_path, os.path.dirname(filename), config)
+        data = None
+    if data is None:
+        with open(part_path, "rb") as f:
+            data = f.read()
+    store_article_file(part_path, filename, data)
+    index_article(filename, data.decode("utf-8"))
 
-        markdown_content = f"# {title}\n\n"
-        markdown_content += f"**Date:** {date_str}\n"
-        markdown_content += f"**Link:** {url}\n"
-        markdown_content += f"**Account:** {folder_name}\n"
-        if digest:
-            markdown_content += f"**Summary:** {digest}\n"
-        markdown_content += "\n"
-        markdown_content += html_to_markdown(main_content)
-        
-        with open(filename, "w", encoding="utf-8") as f:
-            f.write(markdown_content)
-        
-        # Check file size and delete if too small
-        config = load_json(CONFIG_FILE)
-        min_file_size_kb = config.get("min_file_size_kb", 3)
-        min_file_size_bytes = min_file_size_kb * 1024
-        
-        file_size = os.path.getsize(filename)
-        if file_size < min_file_size_bytes:
-            print(f"  [Delete] File too small ({file_size} bytes): {filename}")
-            os.remove(filename)
-        else:
-            print(f"  [Saved] {filename} ({file_size} bytes)")
-        
-        time.sleep(1)
+def finish_article_file(url, part_path, filename, config, data=None):
+    """
+    检查临时文件大小，过小则丢弃并标记为 too_small，否则保存为正式文件，标记为 saved 并发出通知
+    data 为已写入临时文件的内容时不再读取文件大小和内容
+    """
+    min_file_size_bytes = config.get("min_file_size_kb", 3) * 1024
+    file_size = len(data) if data is not None else os.path.getsize(part_path)
+    if file_size < min_file_size_bytes:
+        print(f"  [Delete] File too small ({file_size} bytes): {filename}")
+        os.remove(part_path)
+        get_state_store().set_status(url, "too_small")
+        metrics.inc("articles_total", result="too_small")
+        return
+    install_article_file(part_path, filename, config, data)
+    print(f"  [Saved] {filename} ({file_size} bytes)")
+    get_state_store().set_status(url, "saved")
+    metrics.inc("articles_total", result="saved")
+    notify("saved", link=url, path=filename, size=file_size)
 
-    except Exception as e:
-        print(f"  [Error] Failed to save {title}: {e}")
+def image_extension(url, content_type):
+    fmt = parse_qs(urlparse(url).query).get("wx_fmt", [""])[0].lower()
+    if fmt in IMAGE_EXTENSIONS:
+        return IMAGE_EXTENSIONS[fmt]
+    content_type = (content_type or "").split(";")[0].strip().lower()
+    return IMAGE_EXTENSIONS.get(content_type.replace("image/", ""), "img")
 
-def load_account_latest_articles():
+def mirror_image(url, assets_dir):
     """
-    从 wx_poc.txt 中读取每个公众号的最新文章链接
-    返回字典: {公众号名称: 最新文章链接}
+    下载单张图片，按内容 sha256 命名保存到 assets_dir
+    同一 URL 或相同内容的图片只下载/保存一次；其他公众号目录中已有相同内容时创建硬链接
+    返回相对于文章目录的本地路径，失败时返回 None
     """
-    account_latest = {}
-    if not os.path.exists(OUTPUT_FILE):
-        return account_latest
-    
-    current_account = None
-    with open(OUTPUT_FILE, "r", encoding="utf-8") as f:
-        for line in f:
+    store = get_state_store()
+    known = store.get_image(url)
+    if known and os.path.exists(known[1]):
+        sha256, source = known
+        ext = os.path.splitext(source)[1]
+    else:
+        try:
+            with host_slot(url):
+                resp = get_session().get(url, headers=IMAGE_HEADERS, timeout=30)
+            resp.raise_for_status()
+        except Exception as e:
+            print(f"  [Image] 下载失败 {url}: {e}")
+            return None
+        sha256 = hashlib.sha256(resp.content).hexdigest()
+        ext = "." + image_extension(url, resp.headers.get("Content-Type"))
+        source = store.find_image_by_hash(sha256)
+        if not source or not os.path.exists(source):
+            source = os.path.join(assets_dir, sha256 + ext)
+            if not os.path.exists(source):
+                os.makedirs(assets_dir, exist_ok=True)
+                tmp_path = f"{source}.{threading.get_ident()}.part"
+                with open(tmp_path, "wb") as f:
+                    f.write(resp.content)
+                os.replace(tmp_path, source)
+        store.add_image(url, sha256, source)
+
+    target = os.path.join(assets_dir, sha256 + ext)
+    if not os.path.exists(target):
+        os.makedirs(assets_dir, exist_ok=True)
+        try:
+            os.link(source, target)
+        except OSError:
+            shutil.copyfile(source, target)
+    return f"assets/{sha256}{ext}"
+
+def mirror_images(md_path, account_dir, config):
+    """
+    并发下载 Markdown 中的远程图片到 <公众号目录>/assets/，并把链接改写为本地路径
+    """
+    with open(md_path, "r", encoding="utf-8") as f:
+        content = f.read()
+    urls = list(dict.fromkeys(_MD_IMAGE_RE.findall(content)))
+    if not urls:
+        return
+    assets_dir = os.path.join(account_dir, "assets")
+    workers = max(1, int(config.get("image_workers", DEFAULT_FETCH_WORKERS)))
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        local_paths = dict(zip(urls, executor.map(lambda u: mirror_image(u, assets_dir), urls)))
+    content = _MD_IMAGE_RE.sub(lambda m: f"![]({local_paths.get(m.group(1)) or m.group(1)})", content)
+    with open(md_path, "w", encoding="utf-8") as f:
+        f.write(content)
+
+def stream_url_to_md(article, headers, account_name, date_str, config):
+    """
+    流式保存文章：按块读取响应，边解析 js_content 边把 Markdown 写入临时文件
+    每篇文章只占用固定大小的缓冲区，完成后检查大小再改名为正式文件
+    页面中没有 js_content 时（验证页、已删除文章的提示页等）抛出 MissingContent，按下载失败处理
+    """
+    url = article.get("link")
+    title = article.get("title")
+    digest = article.get("digest", "")
+    known_account = account_name and account_name != "Unknown_Account"
+
+    os.makedirs(ARTICLES_BASE_DIR, exist_ok=True)
+    filename = None
+    if known_account:
+        filename = article_path(account_name, title, date_str)
+        if article_exists(filename):
+            print(f"  [Jump] File exists: {filename}")
+            get_state_store().set_status(url, "saved")
+            metrics.inc("articles_total", result="skipped")
+            return
+
+    fd, part_path = tempfile.mkstemp(suffix=".part", dir=ARTICLES_BASE_DIR)
+    try:
+        nickname = None
+        fallback_nickname = None
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            if known_account:
+                f.write(markdown_header(title, date_str, url, account_name, digest))
+            converter = MarkdownConverter(write=f.write, root_id="js_content")
+            decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+            tail = ""
+            # 流式模式下载和转换交替进行，合并计时
+            with host_slot(url), metrics.timer("stream_fetch_convert"):
+                with get_session().get(url, headers=headers, stream=True, timeout=30) as resp:
+                    resp.raise_for_status()
+                    for chunk in resp.iter_content(chunk_size=STREAM_CHUNK_SIZE):
+                        text = decoder.decode(chunk)
+                        if not known_account and nickname is None:
+                            # 保留上一块的结尾，避免匹配被分块截断
+                            window = tail + text
+                            nick_match = _NICKNAME_RE.search(window)
+                            if nick_match:
+                                nickname = nick_match.group(1)
+                            elif fallback_nickname is None and "profile_meta_nickname" in window:
+                                nick_match_2 = _PROFILE_NICKNAME_RE.search(window)
+                                if nick_match_2:
+                                    fallback_nickname = nick_match_2.group(1).strip()
+                            tail = window[-256:]
+                        converter.feed(text)
+                    converter.feed(decoder.decode(b"", final=True))
+            converter.close()
+        if not converter.root_found:
+            raise MissingContent(f"页面中没有 js_content: {url}")
+        # 流式模式下载和转换同时完成
+        get_state_store().set_status(url, "converted")
+
+        if not known_account:
+            # 公众号名称在下载后才确定，需要把头部写在正文前面
+            folder_name = nickname or fallback_nickname or "Unknown_Account"
+            filename = article_path(folder_name, title, date_str)
+            if article_exists(filename):
+                print(f"  [Jump] File exists: {filename}")
+                get_state_store().set_status(url, "saved")
+                metrics.inc("articles_total", result="skipped")
+                return
+            body_path = part_path
+            fd, part_path = tempfile.mkstemp(suffix=".part", dir=ARTICLES_BASE_DIR)
+            with os.fdopen(fd, "w", encoding="utf-8") as out, open(body_path, "r", encoding="utf-8") as body:
+                out.write(markdown_header(title, date_str, url, folder_name, digest))
+                shutil.copyfileobj(body, out)
+            os.remove(body_path)
+
+        with metrics.timer("write"):
+            finish_article_file(url, part_path, filename, config)
+    finally:
+        if os.path.exists(part_path):
+            os.remove(part_path)
+
+def prefetch_skip_reason(article, account_name, date_str):
+    """
+    下载前的跳过判断，不产生任何网络请求
+    - 状态库中已标记为已保存或过小
+    - 公众号已知时，目标文件已存在
+    返回跳过原因，需要下载时返回 None
+    """
+    store = get_state_store()
+    status = store.get_status(article.get("link"))
+    if status == "saved":
+        return "已保存"
+    if status == "too_small":
+        return "此前判定内容过小"
+    if status == "duplicate":
+        return "与已保存的文章内容相同"
+    if account_name and account_name != "Unknown_Account":
+        filename = os.path.join(ARTICLES_BASE_DIR, clean_filename(account_name),
+                                f"{date_str}_{clean_filename(article.get('title'))}.md")
+        if article_exists(filename):
+            store.set_status(article.get("link"), "saved")
+            return "文件已存在"
+    return None
+
+def article_date_str(article):
+    # Try to find date - create_time is timestamp
+    # 没有发布时间时不能用 0 生成 1970-01-01 的文件名
+    if not article.get("create_time"):
+        return "Unknown"
+    try:
+        return time.strftime("%Y-%m-%d", time.localtime(article.get("create_time")))
+    except:
+        return "Unknown"
+
+def skip_before_fetch(article, account_name, date_str):
+    """下载前先查状态库和目标文件，已保存或判定过小的文章不再下载"""
+    skip_reason = prefetch_skip_reason(article, account_name, date_str)
+    if skip_reason:
+        print(f"  [Jump] {skip_reason}，跳过下载: {article.get('title')}")
+        metrics.inc("articles_total", result="skipped")
+        return True
+    return False
+
+def fetch_article(article, headers, account_name, date_str, config):
+    """
+    下载文章页面并确定保存路径
+    返回待转换的任务（含页面 HTML），目标文件已存在时返回 None
+    """
+    url = article.get("link")
+
+    # Fetch article content (shared connection pool, per-host concurrency cap)
+    with host_slot(url), metrics.timer("page_fetch"):
+        resp, _ = cached_get(url, headers, ttl=config.get("http_cache_article_ttl_seconds", 7 * 86400),
+                             cacheable=has_article_content)
+    resp.raise_for_status()
+    resp.encoding = "utf-8"
+    return prepare_article(article, account_name, date_str, resp.text)
+
+def has_article_content(response):
+    """页面中有正文（js_content）时才写入缓存，验证页等临时页面不缓存"""
+    return b'id="js_content"' in response.content
+
+def prepare_article(article, account_name, date_str, content_html):
+    """
+    页面下载完成后确定公众号名称和保存路径（同步下载和异步引擎共用）
+    返回待转换的任务，目标文件已存在时返回 None
+    """
+    url = article.get("link")
+    title = article.get("title")
+    if 'id="js_content"' not in content_html:
+        raise MissingContent(f"页面中没有 js_content: {url}")
+    get_state_store().set_status(url, "fetched")
+
+    # Use provided account name or try to extract from HTML
+    folder_name = account_name if account_name else "Unknown_Account"
+    if folder_name == "Unknown_Account":
+        with metrics.timer("extract"):
+            folder_name = find_nickname(content_html) or folder_name
+
+    # Create base directory if not exists
+    os.makedirs(ARTICLES_BASE_DIR, exist_ok=True)
+    filename = article_path(folder_name, title, date_str)
+
+    if article_exists(filename):
+        print(f"  [Jump] File exists: {filename}")
+        get_state_store().set_status(url, "saved")
+        metrics.inc("articles_total", result="skipped")
+        return None
+
+    job = {
+        "url": url,
+        "title": title,
+        "filename": filename,
+        "header": markdown_header(title, date_str, url, folder_name, article.get("digest", "")),
+        "html": content_html,
+        "fingerprint": content_fingerprint(content_html),
+    }
+    # 转换前按正文指纹查重，相同内容只保存一次，其余文章写一个指向原文的引用
+    if job["fingerprint"]:
+        original_link, original_path = get_state_store().claim_content(job["fingerprint"], url, filename)
+        if original_link != url:
+            write_duplicate_reference(job, original_link, original_path)
+            return None
+    snapshot_article(job, folder_name, date_str, article.get("digest", ""))
+    return job
+
+def write_duplicate_reference(job, original_link, original_path):
+    """为重复内容的文章写一个引用文件，正文指向已保存的文章"""
+    filename = job["filename"]
+    relative = os.path.relpath(original_path, os.path.dirname(filename)).replace(os.sep, "/")
+    reference = (job["header"]
+                 + f"{DUPLICATE_REFERENCE_MARK}，未重复保存正文：[{os.path.basename(original_path)}](<{relative}>)\n"
+                 + f"> 原文链接：{original_link}\n")
+    part_path = filename + ".part"
+    with open(part_path, "w", encoding="utf-8") as f:
+        f.write(reference)
+    store_article_file(part_path, filename)
+    get_state_store().mark_duplicate(job["url"], original_link)
+    print(f"  [Duplicate] 与已保存的文章内容相同: {job['title']} -> {original_path}")
+    metrics.inc("articles_total", result="duplicate")
+
+def convert_article(content_html, legacy=False):
+    """
+    提取正文并转换为 Markdown
+    只做 CPU 计算，不访问网络和状态库，可以在转换进程中运行
+    返回 (Markdown 正文, 各阶段耗时)
+    """
+    timings = {}
+    start = time.perf_counter()
+    # Convert to Markdown
+    # Only extract the main content container: id="js_content"
+    if legacy:
+        content_match = re.search(r'<div[^>]*id="js_content"[^>]*>(.*?)</div>', content_html, re.DOTALL)
+        
+        if content_match:
+             main_content = content_match.group(1)
+        else:
+             # Fallback: parsing might be complex, use whole response body
+             main_content = re.search(r'<body[^>]*>(.*?)</body>', content_html, re.DOTALL).group(1) if re.search(r'<body', content_html) else content_html
+        timings["extract"] = time.perf_counter() - start
+        start = time.perf_counter()
+        body = html_to_markdown(main_content, legacy=True)
+    else:
+        root_id = "js_content" if 'id="js_content"' in content_html else None
+        body = html_to_markdown(content_html, root_id=root_id)
+    timings["convert"] = time.perf_counter() - start
+    return body, timings
+
+def write_article(job, body, config):
+    """在内存中判断大小，过小的文章不落盘，否则写入临时文件后改名"""
+    url = job["url"]
+    filename = job["filename"]
+    data = (job["header"] + body).encode("utf-8")
+    min_file_size_bytes = config.get("min_file_size_kb", 3) * 1024
+    if len(data) < min_file_size_bytes:
+        print(f"  [Delete] File too small ({len(data)} bytes): {filename}")
+        get_state_store().set_status(url, "too_small")
+        metrics.inc("articles_total", result="too_small")
+        if job.get("fingerprint"):
+            get_state_store().release_content(job["fingerprint"], url)
+        return
+
+    part_path = filename + ".part"
+    try:
+        with metrics.timer("write"):
+            with open(part_path, "wb") as f:
+                f.write(data)
+            
+            # Check file size and delete if too small
+            finish_article_file(url, part_path, filename, config, data)
+        snapshots = get_snapshot_store()
+        if snapshots is not None and article_exists(filename):
+            snapshots.mark_converted(filename, config.get("markdown_converter") == "legacy")
+    finally:
+        if os.path.exists(part_path):
+            os.remove(part_path)
+        if job.get("fingerprint") and not article_exists(filename):
+            get_state_store().release_content(job["fingerprint"], url)
+
+def record_converted(url, timings):
+    for stage, seconds in timings.items():
+        metrics.observe(stage, seconds)
+    get_state_store().set_status(url, "converted")
+
+def article_failed(article, error):
+    print(f"  [Error] Failed to save {article.get('title')}: {error}")
+    get_state_store().mark_failed(article.get("link"))
+    metrics.inc("articles_total", result="error")
+
+def articles_to_save(fakeid):
+    """该公众号待保存的文章：新列出的、上次中断遗留的和可以重试的失败文章"""
+    max_attempts = int(get_config().get("article_max_attempts", DEFAULT_ARTICLE_MAX_ATTEMPTS))
+    return get_state_store().pending_articles(fakeid, max_attempts)
+
+def save_url_to_md(article, headers, account_name=None):
+    url = article.get("link")
+    date_str = article_date_str(article)
+
+    if not url:
+        return
+
+    if skip_before_fetch(article, account_name, date_str):
+        return
+
+    try:
+        config = get_config()
+        legacy = config.get("markdown_converter") == "legacy"
+        if config.get("stream_download") and not legacy:
+            stream_url_to_md(article, headers, account_name, date_str, config)
+            return
+
+        job = fetch_article(article, headers, account_name, date_str, config)
+        if job is None:
+            return
+        body, timings = convert_article(job.pop("html"), legacy)
+        record_converted(url, timings)
+        write_article(job, body, config)
+
+    except Exception as e:
+        article_failed(article, e)
+
+def get_convert_pool(processes):
+    """返回全局共享的转换进程池，进程数变化或子进程异常退出时重建"""
+    global _convert_pool, _convert_pool_size
+    with _session_lock:
+        if _convert_pool is None or _convert_pool_size != processes or _convert_pool._broken:
+            if _convert_pool is not None:
+                _convert_pool.shutdown(wait=False)
+            _convert_pool = ProcessPoolExecutor(max_workers=processes)
+            _convert_pool_size = processes
+        return _convert_pool
+
+def save_articles_pipelined(articles, headers, account_name, config, workers):
+    """
+    下载和转换分离的流水线：
+    下载线程（fetch_workers 个）把页面交给转换进程池（convert_processes 个），
+    转换结果由写入线程落盘；排队等待转换和写入的页面最多 convert_queue_size 篇，
+    队列满时下载线程阻塞，内存占用有上限
+    """
+    legacy = config.get("markdown_converter") == "legacy"
+    processes = int(config["convert_processes"])
+    queue_size = max(1, int(config.get("convert_queue_size", processes * 2)))
+    pool = get_convert_pool(processes)
+    slots = threading.BoundedSemaphore(queue_size)
+    writer = ThreadPoolExecutor(max_workers=workers)
+
+    def on_converted(article, job, future):
+        try:
+            body, timings = future.result()
+            record_converted(job["url"], timings)
+            write_article(job, body, config)
+        except Exception as e:
+            article_failed(article, e)
+        finally:
+            slots.release()
+
+    def fetch(article):
+        date_str = article_date_str(article)
+        if not article.get("link") or skip_before_fetch(article, account_name, date_str):
+            return
+        try:
+            job = fetch_article(article, headers, account_name, date_str, config)
+        except Exception as e:
+            article_failed(article, e)
+            return
+        if job is None:
+            return
+        slots.acquire()
+        try:
+            future = pool.submit(convert_article, job.pop("html"), legacy)
+        except Exception as e:
+            slots.release()
+            article_failed(article, e)
+            return
+        future.add_done_callback(lambda f: writer.submit(on_converted, article, job, f))
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for article in articles:
+            executor.submit(fetch, article)
+    # 取回全部名额即表示所有页面都已转换并写入
+    for _ in range(queue_size):
+        slots.acquire()
+    writer.shutdown(wait=True)
+
+def save_articles(articles, headers, account_name=None):
+    """
+    并发保存文章：使用有界线程池下载文章页面
+    worker 数量由 fetch_workers 控制，同一主机的并发数由 per_host_concurrency 限制
+    配置 convert_processes 时 Markdown 转换交给进程池，不再和下载线程争抢 GIL
+    """
+    global _per_host_limit
+    if not articles:
+        return
+    config = get_config()
+    workers = max(1, int(config.get("fetch_workers", DEFAULT_FETCH_WORKERS)))
+    _per_host_limit = max(1, int(config.get("per_host_concurrency", DEFAULT_PER_HOST_CONCURRENCY)))
+    get_session(max(workers, _per_host_limit))
+
+    # 流式下载边下载边转换，不经过转换进程池
+    streaming = config.get("stream_download") and config.get("markdown_converter") != "legacy"
+    if config.get("convert_processes") and not streaming:
+        save_articles_pipelined(articles, headers, account_name, config, workers)
+        return
+
+    if workers == 1 or len(articles) == 1:
+        for article in articles:
+            save_url_to_md(article, headers, account_name)
+        return
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for article in articles:
+            executor.submit(save_url_to_md, article, headers, account_name)
+
+def load_account_latest_articles():
+    """
+    从 wx_poc.txt 中读取每个公众号的最新文章链接
+    返回字典: {公众号名称: 最新文章链接}
+    """
+    account_latest = {}
+    if not os.path.exists(OUTPUT_FILE):
+        return account_latest
+    
+    current_account = None
+    with open(OUTPUT_FILE, "r", encoding="utf-8") as f:
+        for line in f:
             line = line.strip()
             if line.startswith("文章名字："):
                 # 提取公众号名称（从文件名中）
@@ -329,203 +1935,2208 @@ def load_account_first_article_from_txt():
                 account_first_articles[current_account] = first_article_link
     
     return account_first_articles
-def mode_archive(fakeids, token, cookie, account_names):
-    """存档模式：爬取所有文章"""
+class StateStore:
+    """
+    SQLite 状态库，取代每轮全量扫描 wx_poc.txt
+    - articles: 文章元数据和抓取状态（link 主键，fakeid/发布时间建索引）
+    - accounts: 每个公众号的第一篇文章和上次更新记录
+    - crawl_progress: 未完成的翻页进度，进程中断后从断点继续
+    wx_poc.txt 仍作为日志追加写入，可用 export_log 从状态库重新生成
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS articles (
+            link TEXT PRIMARY KEY,
+            fakeid TEXT,
+            account TEXT,
+            title TEXT,
+            create_time INTEGER DEFAULT 0,
+            digest TEXT DEFAULT '',
+            author TEXT DEFAULT '',
+            status TEXT DEFAULT 'listed',
+            updated_at INTEGER,
+            logged INTEGER DEFAULT 1,
+            canonical TEXT,
+            duplicate_of TEXT,
+            attempts INTEGER DEFAULT 0
+        );
+        CREATE INDEX IF NOT EXISTS idx_articles_fakeid ON articles (fakeid, create_time);
+        CREATE INDEX IF NOT EXISTS idx_articles_create_time ON articles (create_time);
+        CREATE TABLE IF NOT EXISTS accounts (
+            fakeid TEXT PRIMARY KEY,
+            account TEXT,
+            first_title TEXT,
+            first_link TEXT,
+            last_title TEXT,
+            last_url TEXT,
+            watermark_time INTEGER,
+            watermark_msgid INTEGER,
+            updated_at INTEGER
+        );
+    """
+
+    SCHEMA += """
+        CREATE TABLE IF NOT EXISTS images (
+            url TEXT PRIMARY KEY,
+            sha256 TEXT,
+            path TEXT
+        );
+        CREATE INDEX IF NOT EXISTS idx_images_sha256 ON images (sha256);
+    """
+
+    SCHEMA += """
+        CREATE TABLE IF NOT EXISTS crawl_progress (
+            fakeid TEXT PRIMARY KEY,
+            next_begin INTEGER,
+            newest_time INTEGER,
+            newest_msgid INTEGER,
+            updated_at INTEGER
+        );
+    """
+
+    SCHEMA += """
+        CREATE TABLE IF NOT EXISTS contents (
+            hash TEXT PRIMARY KEY,
+            link TEXT,
+            path TEXT,
+            claimed_at INTEGER
+        );
+    """
+
+    SCHEMA += """
+        CREATE TABLE IF NOT EXISTS log_files (
+            path TEXT PRIMARY KEY,
+            size INTEGER,
+            updated_at INTEGER
+        );
+        CREATE TABLE IF NOT EXISTS segment_index (
+            path TEXT PRIMARY KEY,
+            segment TEXT,
+            offset INTEGER,
+            length INTEGER,
+            codec TEXT,
+            size INTEGER,
+            stored_at INTEGER
+        );
+    """
+
+    # 依赖迁移新增列的索引，在迁移之后创建
+    INDEXES = """
+        CREATE INDEX IF NOT EXISTS idx_articles_canonical ON articles (canonical);
+    """
+
+    # 下载中断后需要继续处理的状态：已列出 -> 已下载 -> 已转换 -> saved（已写入）
+    PENDING_STATUSES = ("listed", "fetched", "converted")
+
+    # 旧版状态库缺少的列：列名 -> 类型
+    MIGRATIONS = {
+        "accounts": {"watermark_time": "INTEGER", "watermark_msgid": "INTEGER"},
+        # 旧库中的文章都已写过日志，新增列默认 1
+        "articles": {"logged": "INTEGER DEFAULT 1", "canonical": "TEXT", "duplicate_of": "TEXT",
+                     "attempts": "INTEGER DEFAULT 0"},
+        "contents": {"claimed_at": "INTEGER"},
+    }
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(self.SCHEMA)
+        for table, columns in self.MIGRATIONS.items():
+            existing = {row[1] for row in self.conn.execute(f"PRAGMA table_info({table})")}
+            for column, column_type in columns.items():
+                if column not in existing:
+                    self.conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {column_type}")
+        self.conn.executescript(self.INDEXES)
+        self._fill_canonical()
+        self.conn.commit()
+
+    def _fill_canonical(self):
+        """为旧记录和合并进来的记录补上规范链接"""
+        rows = self.conn.execute("SELECT link FROM articles WHERE canonical IS NULL").fetchall()
+        self.conn.executemany("UPDATE articles SET canonical = ? WHERE link = ?",
+                              [(canonical_link(link), link) for (link,) in rows])
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+    def is_empty(self):
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT (SELECT COUNT(*) FROM articles) + (SELECT COUNT(*) FROM accounts)").fetchone()
+        return row[0] == 0
+
+    def has_link(self, link):
+        with self.lock:
+            return self.conn.execute("SELECT 1 FROM articles WHERE link = ?", (link,)).fetchone() is not None
+
+    def _insert_articles(self, fakeid, account_name, articles, status, logged):
+        """
+        规范链接相同的文章（同一篇文章的不同链接）只保留第一条
+        返回新写入的文章（已有记录的不算）
+        """
+        now = int(time.time())
+        inserted = []
+        for a in articles:
+            if a.get("link"):
+                canonical = canonical_link(a["link"])
+                cur = self.conn.execute(
+                    "INSERT OR IGNORE INTO articles "
+                    "(link, fakeid, account, title, create_time, digest, author, status, updated_at, logged, canonical) "
+                    "SELECT ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ? "
+                    "WHERE NOT EXISTS (SELECT 1 FROM articles WHERE canonical = ?)",
+                    (a["link"], fakeid, account_name, a.get("title"), a.get("create_time") or 0,
+                     a.get("digest", ""), a.get("author", ""), status, now, logged, canonical, canonical))
+                if cur.rowcount:
+                    inserted.append(a)
+        return inserted
+
+    def add_articles(self, fakeid, account_name, articles, status="listed", logged=False):
+        """
+        logged 为 False 的文章会在下次 write_account_log 时追加到 wx_poc.txt
+        返回新写入的文章
+        """
+        with self.lock:
+            inserted = self._insert_articles(fakeid, account_name, articles, status, int(logged))
+            self.conn.commit()
+        return inserted
+
+    def get_progress(self, fakeid):
+        """返回未完成的翻页进度 (下一页 begin, 已看到的最新位置)，没有时返回 None"""
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT next_begin, newest_time, newest_msgid FROM crawl_progress WHERE fakeid = ?",
+                (fakeid,)).fetchone()
+        if row is None:
+            return None
+        newest = (row[1], row[2] or 0) if row[1] is not None else None
+        return row[0], newest
+
+    def save_page(self, fakeid, account_name, articles, next_begin, newest):
+        """
+        一页文章和翻页进度在同一事务中写入，中断后不会重复列出或漏掉文章
+        返回新写入的文章
+        """
+        with self.lock:
+            inserted = self._insert_articles(fakeid, account_name, articles, "listed", 0)
+            self.conn.execute(
+                "INSERT OR REPLACE INTO crawl_progress (fakeid, next_begin, newest_time, newest_msgid, updated_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (fakeid, next_begin, newest[0] if newest else None, newest[1] if newest else None,
+                 int(time.time())))
+            self.conn.commit()
+        return inserted
+
+    def finish_listing(self, fakeid, newest):
+        """翻页完成：推进水位线并清除进度"""
+        with self.lock:
+            if newest is not None:
+                self.conn.execute(
+                    "INSERT INTO accounts (fakeid, watermark_time, watermark_msgid, updated_at) VALUES (?, ?, ?, ?) "
+                    "ON CONFLICT(fakeid) DO UPDATE SET watermark_time = excluded.watermark_time, "
+                    "watermark_msgid = excluded.watermark_msgid, updated_at = excluded.updated_at",
+                    (fakeid, newest[0], newest[1], int(time.time())))
+            self.conn.execute("DELETE FROM crawl_progress WHERE fakeid = ?", (fakeid,))
+            self.conn.commit()
+
+    def _article_rows(self, sql, params):
+        cur = self.conn.execute(sql, params)
+        columns = [c[0] for c in cur.description]
+        return [dict(zip(columns, row)) for row in cur.fetchall()]
+
+    def pending_articles(self, fakeid, max_attempts=DEFAULT_ARTICLE_MAX_ATTEMPTS):
+        """
+        列出但尚未保存完成的文章（含上次中断遗留的），按发布时间从新到旧
+        下载或转换失败的文章失败次数少于 max_attempts 时也会重试
+        """
+        marks = ", ".join("?" * len(self.PENDING_STATUSES))
+        with self.lock:
+            return self._article_rows(
+                "SELECT link, title, create_time, digest, author, status FROM articles "
+                f"WHERE fakeid = ? AND (status IN ({marks}) OR (status = 'error' AND attempts < ?)) "
+                "ORDER BY create_time DESC, rowid",
+                (fakeid, *self.PENDING_STATUSES, max_attempts))
+
+    def unlogged_articles(self, fakeid):
+        with self.lock:
+            return self._article_rows(
+                "SELECT link, title, create_time FROM articles WHERE fakeid = ? AND logged = 0 "
+                "ORDER BY create_time DESC, rowid", (fakeid,))
+
+    def claim_content(self, fingerprint, link, path, stale_after=CONTENT_CLAIM_STALE_SECONDS):
+        """
+        登记正文指纹，返回最先登记该指纹的 (链接, 文件路径)
+        返回的链接不是 link 时说明是重复内容。原文还在下载或转换时文件尚未写出，不能据此接管；
+        只有原文保存失败（too_small / error），或登记超过 stale_after 秒（如进程中断）且文件不存在时才由本文接管
+        """
+        now = int(time.time())
+        # 登记和读取在同一次加锁内完成，并发登记同一指纹时只有一篇成为原文；原文重试时刷新登记时间
+        with self.lock:
+            self.conn.execute(
+                "INSERT INTO contents (hash, link, path, claimed_at) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT(hash) DO UPDATE SET claimed_at = excluded.claimed_at WHERE link = excluded.link",
+                (fingerprint, link, path, now))
+            self.conn.commit()
+            owner, owner_path, claimed_at, status = self.conn.execute(
+                "SELECT c.link, c.path, c.claimed_at, a.status FROM contents c "
+                "LEFT JOIN articles a ON a.link = c.link WHERE c.hash = ?", (fingerprint,)).fetchone()
+        if owner == link:
+            return owner, owner_path
+        failed = status in ("too_small", "error")
+        stale = now - (claimed_at or 0) >= stale_after
+        # 检查文件时不持有锁：分段模式下 article_exists 也要查询状态库
+        if not (failed or stale) or article_exists(owner_path):
+            return owner, owner_path
+        # 只在登记仍属于原来那篇时接管，避免覆盖其他线程刚完成的接管；登记期间被撤销时重新登记
+        with self.lock:
+            self.conn.execute("UPDATE contents SET link = ?, path = ?, claimed_at = ? WHERE hash = ? AND link = ?",
+                              (link, path, now, fingerprint, owner))
+            self.conn.execute("INSERT OR IGNORE INTO contents (hash, link, path, claimed_at) VALUES (?, ?, ?, ?)",
+                              (fingerprint, link, path, now))
+            self.conn.commit()
+            return self.conn.execute("SELECT link, path FROM contents WHERE hash = ?", (fingerprint,)).fetchone()
+
+    def release_content(self, fingerprint, link):
+        """文章最终没有保存（过小或出错）时撤销登记，让后续相同内容的文章正常保存"""
+        with self.lock:
+            self.conn.execute("DELETE FROM contents WHERE hash = ? AND link = ?", (fingerprint, link))
+            self.conn.commit()
+
+    def mark_duplicate(self, link, original_link):
+        with self.lock:
+            self.conn.execute("UPDATE articles SET status = 'duplicate', duplicate_of = ?, updated_at = ? "
+                              "WHERE link = ?", (original_link, int(time.time()), link))
+            self.conn.commit()
+
+    def duplicates_of(self, link):
+        """转载了 link 这篇文章的其他文章链接"""
+        with self.lock:
+            return [row[0] for row in self.conn.execute(
+                "SELECT link FROM articles WHERE duplicate_of = ? ORDER BY create_time", (link,))]
+
+    def add_segment_entry(self, path, segment, offset, length, codec, size):
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO segment_index (path, segment, offset, length, codec, size, stored_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)", (path, segment, offset, length, codec, size, int(time.time())))
+            self.conn.commit()
+
+    def get_segment_entry(self, path):
+        """返回 (分段文件, 偏移, 长度, 压缩方式)，没有记录时返回 None"""
+        with self.lock:
+            return self.conn.execute("SELECT segment, offset, length, codec FROM segment_index WHERE path = ?",
+                                     (path,)).fetchone()
+
+    def segment_paths(self, prefix=None):
+        """分段中保存的文章路径，prefix 为公众号目录时只返回该公众号的文章"""
+        with self.lock:
+            if prefix:
+                rows = self.conn.execute(
+                    "SELECT path FROM segment_index WHERE substr(path, 1, length(?1)) = ?1 ORDER BY path",
+                    (prefix + os.sep,)).fetchall()
+            else:
+                rows = self.conn.execute("SELECT path FROM segment_index ORDER BY path").fetchall()
+        return [row[0] for row in rows]
+
+    def mark_logged(self, links, log_path=None, log_size=None):
+        """标记文章已写入日志，同时记录日志文件写入完成后的大小"""
+        with self.lock:
+            self.conn.executemany("UPDATE articles SET logged = 1 WHERE link = ?", [(link,) for link in links])
+            if log_path is not None:
+                self.conn.execute("INSERT OR REPLACE INTO log_files (path, size, updated_at) VALUES (?, ?, ?)",
+                                  (log_path, log_size, int(time.time())))
+            self.conn.commit()
+
+    def get_log_size(self, path):
+        """返回日志文件上一批写入完成后的大小，没有记录时返回 None"""
+        with self.lock:
+            row = self.conn.execute("SELECT size FROM log_files WHERE path = ?", (path,)).fetchone()
+        return row[0] if row else None
+
+    def seed_accounts(self, path, fakeids):
+        """从另一个状态库复制指定公众号的记录（水位线等），分片存档时跳过公共库中已有的文章"""
+        with self.lock:
+            self.conn.execute("ATTACH DATABASE ? AS other", (path,))
+            try:
+                marks = ", ".join("?" * len(fakeids))
+                columns = ("fakeid, account, first_title, first_link, last_title, last_url, "
+                           "watermark_time, watermark_msgid, updated_at")
+                self.conn.execute(
+                    f"INSERT OR IGNORE INTO accounts ({columns}) "
+                    f"SELECT {columns} FROM other.accounts WHERE fakeid IN ({marks})",
+                    list(fakeids))
+                self.conn.commit()
+            finally:
+                self.conn.execute("DETACH DATABASE other")
+
+    def merge_from(self, path, old_prefix=None, new_prefix=None):
+        """
+        合并分片状态库
+        - 新文章标记为未记录日志，已保存的状态覆盖未完成的状态
+        - 水位线取较新的一方
+        - 图片路径从分片目录 old_prefix 改写到公共目录 new_prefix
+        返回有新文章的 (fakeid, 公众号名称) 列表
+        """
+        now = int(time.time())
+        with self.lock:
+            self.conn.execute("ATTACH DATABASE ? AS shard", (path,))
+            try:
+                accounts = self.conn.execute(
+                    "SELECT DISTINCT s.fakeid, s.account FROM shard.articles s WHERE s.fakeid IS NOT NULL "
+                    "AND NOT EXISTS (SELECT 1 FROM articles a WHERE a.link = s.link)").fetchall()
+                self.conn.execute(
+                    "INSERT OR IGNORE INTO articles "
+                    "(link, fakeid, account, title, create_time, digest, author, status, updated_at, logged) "
+                    "SELECT link, fakeid, account, title, create_time, digest, author, status, updated_at, 0 "
+                    "FROM shard.articles")
+                self.conn.execute(
+                    "UPDATE articles SET status = 'saved', updated_at = ? WHERE status != 'saved' "
+                    "AND link IN (SELECT link FROM shard.articles WHERE status = 'saved')", (now,))
+                self.conn.execute(
+                    "INSERT INTO accounts (fakeid, account, first_title, first_link, last_title, last_url, "
+                    "watermark_time, watermark_msgid, updated_at) "
+                    "SELECT fakeid, account, first_title, first_link, last_title, last_url, "
+                    "watermark_time, watermark_msgid, updated_at FROM shard.accounts WHERE true "
+                    "ON CONFLICT(fakeid) DO UPDATE SET account = coalesce(excluded.account, account), "
+                    "watermark_time = excluded.watermark_time, watermark_msgid = excluded.watermark_msgid, "
+                    "updated_at = excluded.updated_at "
+                    "WHERE excluded.watermark_time IS NOT NULL AND (watermark_time IS NULL "
+                    "OR excluded.watermark_time > watermark_time "
+                    "OR (excluded.watermark_time = watermark_time AND excluded.watermark_msgid > watermark_msgid))")
+                if old_prefix and new_prefix:
+                    self.conn.execute(
+                        "INSERT OR IGNORE INTO images (url, sha256, path) "
+                        "SELECT url, sha256, CASE WHEN substr(path, 1, length(?1)) = ?1 "
+                        "THEN ?2 || substr(path, length(?1) + 1) ELSE path END FROM shard.images",
+                        (old_prefix, new_prefix))
+                self.conn.execute(
+                    "INSERT OR IGNORE INTO contents (hash, link, path) "
+                    "SELECT hash, link, CASE WHEN substr(path, 1, length(?1)) = ?1 "
+                    "THEN ?2 || substr(path, length(?1) + 1) ELSE path END FROM shard.contents",
+                    (old_prefix or "", new_prefix or ""))
+                self.conn.execute(
+                    "INSERT OR IGNORE INTO segment_index (path, segment, offset, length, codec, size, stored_at) "
+                    "SELECT ?2 || substr(path, length(?1) + 1), ?2 || substr(segment, length(?1) + 1), "
+                    "offset, length, codec, size, stored_at FROM shard.segment_index "
+                    "WHERE substr(path, 1, length(?1)) = ?1",
+                    (old_prefix or "", new_prefix or ""))
+                self._fill_canonical()
+                self.conn.commit()
+            finally:
+                self.conn.execute("DETACH DATABASE shard")
+        return accounts
+
+    def get_status(self, link):
+        with self.lock:
+            row = self.conn.execute("SELECT status FROM articles WHERE link = ?", (link,)).fetchone()
+        return row[0] if row else None
+
+    def mark_failed(self, link):
+        """记录一次保存失败，失败次数达到上限前 pending_articles 会继续返回该文章"""
+        with self.lock:
+            self.conn.execute("UPDATE articles SET status = 'error', attempts = attempts + 1, updated_at = ? "
+                              "WHERE link = ?", (int(time.time()), link))
+            self.conn.commit()
+
+    def set_status(self, link, status):
+        with self.lock:
+            self.conn.execute("UPDATE articles SET status = ?, updated_at = ? WHERE link = ?",
+                              (status, int(time.time()), link))
+            self.conn.commit()
+
+    def get_account(self, fakeid):
+        with self.lock:
+            cur = self.conn.execute("SELECT * FROM accounts WHERE fakeid = ?", (fakeid,))
+            row = cur.fetchone()
+            return dict(zip([c[0] for c in cur.description], row)) if row else {}
+
+    def update_account(self, fakeid, **fields):
+        """更新公众号记录，fields 为 accounts 表中的列"""
+        fields["updated_at"] = int(time.time())
+        columns = ", ".join(fields)
+        updates = ", ".join(f"{k} = excluded.{k}" for k in fields)
+        with self.lock:
+            self.conn.execute(
+                f"INSERT INTO accounts (fakeid, {columns}) VALUES (?{', ?' * len(fields)}) "
+                f"ON CONFLICT(fakeid) DO UPDATE SET {updates}",
+                (fakeid, *fields.values()))
+            self.conn.commit()
+
+    def get_image(self, url):
+        """返回已镜像图片的 (sha256, 本地路径)，未下载过返回 None"""
+        with self.lock:
+            return self.conn.execute("SELECT sha256, path FROM images WHERE url = ?", (url,)).fetchone()
+
+    def find_image_by_hash(self, sha256):
+        with self.lock:
+            row = self.conn.execute("SELECT path FROM images WHERE sha256 = ? LIMIT 1", (sha256,)).fetchone()
+        return row[0] if row else None
+
+    def add_image(self, url, sha256, path):
+        with self.lock:
+            self.conn.execute("INSERT OR REPLACE INTO images (url, sha256, path) VALUES (?, ?, ?)", (url, sha256, path))
+            self.conn.commit()
+
+    def get_watermark(self, fakeid):
+        """返回 (发布时间, msgid) 水位线，没有记录时返回 None"""
+        account = self.get_account(fakeid)
+        if account.get("watermark_time") is None:
+            return None
+        return (account["watermark_time"], account.get("watermark_msgid") or 0)
+
+    def set_watermark(self, fakeid, watermark):
+        self.update_account(fakeid, watermark_time=watermark[0], watermark_msgid=watermark[1])
+
+    def import_legacy(self, fakeid_by_name=None, output_file=None, history_file=None):
+        """
+        导入旧的 wx_poc.txt 和 history.json（未指定时使用当前的 OUTPUT_FILE / HISTORY_FILE）
+        fakeid_by_name 用于把日志中的公众号名称对应到 fakeid，对应不上的只导入文章
+        返回导入的文章数
+        """
+        output_file = output_file or OUTPUT_FILE
+        history_file = history_file or HISTORY_FILE
+        fakeid_by_name = fakeid_by_name or {}
+        imported = 0
+        if os.path.exists(output_file):
+            account_name = None
+            first_title = None
+            title = None
+            with open(output_file, "r", encoding="utf-8") as f:
+                for line in f:
+                    line = line.strip()
+                    if line.startswith("公众号："):
+                        account_name = line.replace("公众号：", "")
+                    elif line.startswith("第一篇文章："):
+                        first_title = line.replace("第一篇文章：", "")
+                    elif line.startswith("第一篇文章链接：") and account_name in fakeid_by_name:
+                        self.update_account(fakeid_by_name[account_name], account=account_name,
+                                            first_title=first_title,
+                                            first_link=line.replace("第一篇文章链接：", ""))
+                    elif line.startswith("文章名字："):
+                        title = line.replace("文章名字：", "")
+                    elif line.startswith("文章链接："):
+                        # 旧日志中的文章都已处理过，按已保存导入，不会再次下载
+                        article = {"title": title, "link": line.replace("文章链接：", "")}
+                        self.add_articles(fakeid_by_name.get(account_name), account_name, [article],
+                                          status="saved", logged=True)
+                        imported += 1
+        for fakeid, info in load_json(history_file).items():
+            self.update_account(fakeid, last_title=info.get("last_article_title"),
+                                last_url=info.get("last_article_url"))
+            if info.get("watermark_time") is not None:
+                self.set_watermark(fakeid, (info["watermark_time"], info.get("watermark_msgid", 0)))
+        return imported
+
+    def export_log(self, path):
+        """按旧格式导出 wx_poc.txt，每个公众号一段，文章按发布时间从新到旧排列"""
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT account, title, link FROM articles ORDER BY account, create_time DESC, rowid").fetchall()
+        groups = {}
+        for account_name, title, link in rows:
+            groups.setdefault(account_name or "Unknown_Account", []).append({"title": title, "link": link})
+        with open(path, "w", encoding="utf-8") as f:
+            for account_name, articles in groups.items():
+                f.write(format_account_log(account_name, articles))
+        # 导出覆盖了正在写入的日志时更新记录的大小，避免下次写入时被当作不完整的内容截掉
+        with self.lock:
+            self.conn.execute("UPDATE log_files SET size = ?, updated_at = ? WHERE path = ?",
+                              (os.path.getsize(path), int(time.time()), path))
+            self.conn.commit()
+        return len(rows)
+
+def get_state_store():
+    """
+    返回全局共享的状态库，首次打开空库时自动导入旧的 wx_poc.txt/history.json
+    分片状态库不导入：公共日志和 history.json 属于全部公众号，分片所需的水位线由 seed_accounts 复制
+    """
+    global _state_store
+    with _session_lock:
+        if _state_store is None:
+            store = StateStore(STATE_DB_FILE)
+            if (_shard is None and store.is_empty()
+                    and (os.path.exists(OUTPUT_FILE) or os.path.exists(HISTORY_FILE))):
+                count = store.import_legacy(load_fakeids_by_name())
+                print(f"已从 {OUTPUT_FILE} 导入 {count} 篇文章记录到 {STATE_DB_FILE}")
+            _state_store = store
+        return _state_store
+
+def compress_record(data, codec):
+    if codec == "zstd":
+        return zstandard.ZstdCompressor().compress(data)
+    return gzip.compress(data)
+
+def decompress_record(data, codec):
+    if codec == "zstd":
+        return zstandard.ZstdDecompressor().decompress(data)
+    return gzip.decompress(data)
+
+class SegmentStore:
+    """
+    文章分段存储（storage 设为 segments 时使用）
+    每个公众号的文章追加写入 <公众号目录>/segments/ 下的压缩分段文件，每篇文章单独压缩（gzip member 或 zstd frame），
+    状态库 segment_index 表记录 文章路径 -> (分段文件, 偏移, 长度)，可以随机读取单篇文章
+    文章路径与文件模式下的 .md 路径相同，export 可以把文章还原为独立文件
+    """
+
+    def __init__(self, state_store, codec="gzip", max_segment_bytes=64 * 1024 * 1024):
+        if codec == "zstd" and zstandard is None:
+            print("[Storage] 未安装 zstandard，改用 gzip 压缩")
+            codec = "gzip"
+        self.state = state_store
+        self.codec = codec
+        self.max_segment_bytes = max_segment_bytes
+        self.lock = threading.Lock()
+        self.account_locks = {}
+        self.current = {}
+
+    def _account_lock(self, segments_dir):
+        with self.lock:
+            return self.account_locks.setdefault(segments_dir, threading.Lock())
+
+    def _segment_for(self, segments_dir):
+        """返回当前可追加的分段文件，写满后新建；文件名带时间和随机后缀，合并分片时不会重名"""
+        path = self.current.get(segments_dir)
+        if path is None and os.path.isdir(segments_dir):
+            suffix = f".md.{'zst' if self.codec == 'zstd' else 'gz'}"
+            existing = sorted(name for name in os.listdir(segments_dir) if name.endswith(suffix))
+            if existing:
+                path = os.path.join(segments_dir, existing[-1])
+        if path is None or (os.path.exists(path) and os.path.getsize(path) >= self.max_segment_bytes):
+            os.makedirs(segments_dir, exist_ok=True)
+            name = f"{time.strftime('%Y%m%d%H%M%S')}-{os.urandom(3).hex()}.md.{'zst' if self.codec == 'zstd' else 'gz'}"
+            path = os.path.join(segments_dir, name)
+        self.current[segments_dir] = path
+        return path
+
+    def exists(self, path):
+        return self.state.get_segment_entry(path) is not None
+
+    def put(self, path, data):
+        """压缩一篇文章并追加到所在公众号的分段文件"""
+        segments_dir = os.path.join(os.path.dirname(path), "segments")
+        record = compress_record(data, self.codec)
+        with self._account_lock(segments_dir):
+            segment = self._segment_for(segments_dir)
+            with open(segment, "ab") as f:
+                offset = f.tell()
+                f.write(record)
+        self.state.add_segment_entry(path, segment, offset, len(record), self.codec, len(data))
+
+    def get(self, path):
+        entry = self.state.get_segment_entry(path)
+        if entry is None:
+            return None
+        segment, offset, length, codec = entry
+        with open(segment, "rb") as f:
+            f.seek(offset)
+            return decompress_record(f.read(length), codec)
+
+    def export(self, target_dir, account=None):
+        """把分段中的文章还原为 target_dir/<公众号>/<文件名>.md，已存在的文件跳过，返回导出数量"""
+        count = 0
+        for path in self.state.segment_paths(account and os.path.join(ARTICLES_BASE_DIR, clean_filename(account))):
+            target = os.path.join(target_dir, os.path.relpath(path, ARTICLES_BASE_DIR))
+            if os.path.exists(target):
+                continue
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            with open(target, "wb") as f:
+                f.write(self.get(path))
+            count += 1
+        return count
+
+def get_segment_store():
+    """storage 配置为 segments 时返回全局分段存储，否则返回 None（文章保存为独立文件）"""
+    global _segment_store
+    config = get_config()
+    if config.get("storage", "files") != "segments":
+        return None
+    state = get_state_store()
+    with _session_lock:
+        if _segment_store is None or _segment_store.state is not state:
+            _segment_store = SegmentStore(state, config.get("storage_codec", "gzip"),
+                                          int(config.get("segment_max_mb", 64) * 1024 * 1024))
+        return _segment_store
+
+def article_exists(path):
+    """文章是否已保存：文件模式检查文件，分段模式查分段索引（不访问文件系统）"""
+    segments = get_segment_store()
+    if segments is None:
+        return os.path.exists(path)
+    return segments.exists(path)
+
+def store_article_file(part_path, path, data=None):
+    """
+    把写好的临时文件存为正式文章：文件模式改名为 path，分段模式压缩追加到分段文件后删除临时文件
+    data 为临时文件的内容时分段模式不再读取文件
+    """
+    segments = get_segment_store()
+    if segments is None:
+        os.replace(part_path, path)
+        return
+    if data is None:
+        with open(part_path, "rb") as f:
+            data = f.read()
+    segments.put(path, data)
+    os.remove(part_path)
+
+_CJK_RUN_RE = re.compile(r"[\u3400-\u9fff\uf900-\ufaff]+")
+_URL_RE = re.compile(r"https?://\S+")
+_MATCH_QUOTE_RE = re.compile(r'"')
+# 紧跟在中文后面的英文、数字等词（unicode61 视为一个词项，不含中文）
+_WORD_RE = re.compile(r"(?:(?![\u3400-\u9fff\uf900-\ufaff])[^\W_])+")
+# 重复内容引用文件的正文开头，不加入检索索引
+DUPLICATE_REFERENCE_MARK = "> 本文与已保存的文章内容相同"
+
+def bigram_text(text):
+    """把连续的中文字符切成重叠的二元组（中华人民 -> 中华 华人 人民），其他文字原样保留"""
+    def split(match):
+        run = match.group(0)
+        if len(run) == 1:
+            return f" {run} "
+        return " " + " ".join(run[i:i + 2] for i in range(len(run) - 1)) + " "
+    return _CJK_RUN_RE.sub(split, text)
+
+def tail_terms(text):
+    """
+    每段连续中文（两字以上）的最后一个字，紧跟英文或数字时连同这个词，如 我们在华中。 -> 中，大模型GPT -> 型 GPT
+    这些字不是任何二元组的开头，单独索引在 tails 列，单字查询按前缀匹配时才不会漏掉；
+    放在单独的列中不会插进正文的二元组之间，不影响短语匹配
+    """
+    terms = []
+    for match in _CJK_RUN_RE.finditer(text):
+        if match.end() - match.start() < 2:
+            continue
+        terms.append(text[match.end() - 1])
+        word = _WORD_RE.match(text, match.end())
+        if word:
+            terms.append(word.group(0))
+    return " ".join(terms)
+
+def build_match_query(query):
+    """
+    把用户输入的关键词转换为 FTS5 查询
+    空格分隔的多个关键词须同时出现；每个关键词按二元组切分后作为短语匹配，单个汉字按前缀匹配
+    """
+    terms = []
+    for term in query.split():
+        tokens = bigram_text(term).split()
+        if not tokens:
+            continue
+        phrase = '"' + " ".join(_MATCH_QUOTE_RE.sub('""', t) for t in tokens) + '"'
+        if len(tokens) == 1 and _CJK_RUN_RE.fullmatch(tokens[0]) and len(tokens[0]) == 1:
+            phrase += "*"
+        terms.append(phrase)
+    return " AND ".join(terms)
+
+def parse_markdown_header(markdown):
+    """
+    拆分 markdown_header 生成的头部和正文
+    返回 ({title, date, link, account}, 正文)
+    """
+    info = {}
+    lines = markdown.split("\n")
+    body_start = 0
+    for i, line in enumerate(lines[:8]):
+        if line.startswith("# ") and "title" not in info:
+            info["title"] = line[2:].strip()
+            body_start = i + 1
+        for key, label in (("date", "**Date:** "), ("link", "**Link:** "), ("account", "**Account:** "),
+                           ("summary", "**Summary:** ")):
+            if line.startswith(label):
+                info[key] = line[len(label):].strip()
+                body_start = i + 1
+    return info, "\n".join(lines[body_start:]).strip()
+
+class SearchIndex:
+    """
+    全文检索索引（SQLite FTS5，保存在 search.db）
+    - 中文切成重叠二元组后由 unicode61 分词，英文和数字按词索引；每段中文的最后一个字另外索引在 tails 列
+    - 索引表不保存正文（contentless），文章的路径、标题、公众号、日期保存在 docs 表
+    - 同一路径重新索引时旧记录标记为失效，查询时过滤
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS docs (
+            id INTEGER PRIMARY KEY,
+            path TEXT,
+            link TEXT,
+            account TEXT,
+            title TEXT,
+            date TEXT,
+            active INTEGER DEFAULT 1
+        );
+        CREATE INDEX IF NOT EXISTS idx_docs_path ON docs (path);
+        CREATE INDEX IF NOT EXISTS idx_docs_account ON docs (account, date);
+        CREATE VIRTUAL TABLE IF NOT EXISTS docs_fts USING fts5(title, body, tails, content='', tokenize='unicode61');
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(self.SCHEMA)
+        self.conn.commit()
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+    def clear(self):
+        """清空索引，重建时使用（同时清掉重新索引留下的失效记录）"""
+        with self.lock:
+            self.conn.execute("DELETE FROM docs")
+            self.conn.execute("INSERT INTO docs_fts (docs_fts) VALUES ('delete-all')")
+            self.conn.commit()
+
+    def is_indexed(self, path):
+        with self.lock:
+            return self.conn.execute("SELECT 1 FROM docs WHERE path = ? AND active = 1", (path,)).fetchone() is not None
+
+    def add(self, path, markdown):
+        """索引一篇文章，重复内容的引用文件不索引；返回是否加入了索引"""
+        info, body = parse_markdown_header(markdown)
+        if body.startswith(DUPLICATE_REFERENCE_MARK):
+            return False
+        title = info.get("title", os.path.splitext(os.path.basename(path))[0])
+        with self.lock:
+            self.conn.execute("UPDATE docs SET active = 0 WHERE path = ?", (path,))
+            cur = self.conn.execute(
+                "INSERT INTO docs (path, link, account, title, date) VALUES (?, ?, ?, ?, ?)",
+                (path, info.get("link"), info.get("account"), title, info.get("date")))
+            text = _URL_RE.sub(" ", info.get("summary", "") + "\n" + body)
+            self.conn.execute("INSERT INTO docs_fts (rowid, title, body, tails) VALUES (?, ?, ?, ?)",
+                              (cur.lastrowid, bigram_text(title), bigram_text(text),
+                               tail_terms(title + "\n" + text)))
+            self.conn.commit()
+        return True
+
+    def search(self, query, account=None, since=None, until=None, limit=20):
+        """
+        按关键词检索，可按公众号和日期范围（YYYY-MM-DD，含首尾）过滤
+        返回按相关度排序的文章列表
+        """
+        match = build_match_query(query)
+        if not match:
+            return []
+        sql = ("SELECT d.path, d.link, d.account, d.title, d.date FROM docs_fts "
+               "JOIN docs d ON d.id = docs_fts.rowid WHERE docs_fts MATCH ? AND d.active = 1")
+        params = [match]
+        for clause, value in (("d.account = ?", account), ("d.date >= ?", since), ("d.date <= ?", until)):
+            if value:
+                sql += f" AND {clause}"
+                params.append(value)
+        sql += " ORDER BY docs_fts.rank LIMIT ?"
+        params.append(limit)
+        with self.lock:
+            cur = self.conn.execute(sql, params)
+            columns = [c[0] for c in cur.description]
+            return [dict(zip(columns, row)) for row in cur.fetchall()]
+
+def get_search_index():
+    """返回全局检索索引；search_index 设为 false 或 SQLite 不支持 FTS5 时返回 None"""
+    global _search_index
+    if not get_config().get("search_index", True):
+        return None
+    with _session_lock:
+        if _search_index is None:
+            try:
+                _search_index = SearchIndex(SEARCH_DB_FILE)
+            except sqlite3.OperationalError as e:
+                print(f"[Search] 当前 SQLite 不支持 FTS5，全文检索已关闭: {e}")
+                _search_index = False
+        return _search_index or None
+
+def index_article(path, markdown):
+    """保存文章后加入检索索引，索引失败不影响保存"""
+    index = get_search_index()
+    if index is None:
+        return
+    try:
+        with metrics.timer("index"):
+            index.add(path, markdown)
+    except Exception as e:
+        print(f"  [Search] 索引失败 {path}: {e}")
+
+def read_article(path):
+    """读取已保存的文章，分段模式下从分段文件读取"""
+    segments = get_segment_store()
+    data = segments.get(path) if segments is not None else None
+    if data is None:
+        with open(path, "rb") as f:
+            data = f.read()
+    return data.decode("utf-8")
+
+def index_archive(rebuild=False):
+    """
+    把已保存的文章（文件和分段）加入检索索引，已索引的跳过；rebuild 时全部重新索引
+    返回新索引的文章数
+    """
+    index = get_search_index()
+    if index is None:
+        return 0
+    if rebuild:
+        index.clear()
+    paths = []
+    for root, dirs, files in os.walk(ARTICLES_BASE_DIR):
+        dirs[:] = [d for d in dirs if d not in ("assets", "segments")]
+        paths.extend(os.path.join(root, name) for name in files if name.endswith(".md"))
+    paths.extend(get_state_store().segment_paths())
+    count = 0
+    for path in paths:
+        if index.is_indexed(path):
+            continue
+        try:
+            if index.add(path, read_article(path)):
+                count += 1
+        except (OSError, UnicodeDecodeError) as e:
+            print(f"[Search] 读取失败 {path}: {e}")
+    return count
+
+class SnapshotStore:
+    """
+    原始页面快照（保存在 snapshots.db，html_snapshots 设为 false 时关闭）
+    下载后保存压缩的 js_content 片段和文章元数据，改进转换器后可用 --reconvert 在本地重新生成 Markdown，不需要重新下载
+    converted 记录上次转换使用的 转换器版本/转换方式/片段 sha256，未变化的文章重新转换时跳过
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS snapshots (
+            path TEXT PRIMARY KEY,
+            link TEXT,
+            account TEXT,
+            title TEXT,
+            date TEXT,
+            digest TEXT DEFAULT '',
+            codec TEXT,
+            html BLOB,
+            html_hash TEXT,
+            converted TEXT,
+            fetched_at INTEGER
+        );
+        CREATE INDEX IF NOT EXISTS idx_snapshots_account ON snapshots (account);
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.codec = "zstd" if zstandard is not None else "gzip"
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(self.SCHEMA)
+        self.conn.commit()
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+    def put(self, path, link, account, title, date_str, digest, fragment):
+        """保存一篇文章的 js_content 片段，同一路径重新下载时覆盖"""
+        data = fragment.encode("utf-8")
+        record = compress_record(data, self.codec)
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO snapshots "
+                "(path, link, account, title, date, digest, codec, html, html_hash, converted, fetched_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, NULL, ?)",
+                (path, link, account, title, date_str, digest or "", self.codec, record,
+                 hashlib.sha256(data).hexdigest(), int(time.time())))
+            self.conn.commit()
+
+    def mark_converted(self, path, legacy):
+        """记录文章已按当前转换器生成 Markdown"""
+        with self.lock:
+            self.conn.execute("UPDATE snapshots SET converted = ? || '/' || html_hash WHERE path = ?",
+                              (converter_key(legacy), path))
+            self.conn.commit()
+
+    def paths(self, account=None):
+        with self.lock:
+            if account:
+                rows = self.conn.execute("SELECT path FROM snapshots WHERE account = ? ORDER BY path", (account,))
+            else:
+                rows = self.conn.execute("SELECT path FROM snapshots ORDER BY path")
+            return [row[0] for row in rows.fetchall()]
+
+    def get(self, path):
+        """返回快照记录（字典，html 为压缩数据），没有记录时返回 None"""
+        with self.lock:
+            cur = self.conn.execute("SELECT * FROM snapshots WHERE path = ?", (path,))
+            row = cur.fetchone()
+            return dict(zip([c[0] for c in cur.description], row)) if row else None
+
+    def merge_from(self, path, old_prefix, new_prefix):
+        """合并分片的快照库，路径从分片目录 old_prefix 改写到公共目录 new_prefix，已有的记录不覆盖"""
+        with self.lock:
+            self.conn.execute("ATTACH DATABASE ? AS shard", (path,))
+            try:
+                self.conn.execute(
+                    "INSERT OR IGNORE INTO snapshots "
+                    "(path, link, account, title, date, digest, codec, html, html_hash, converted, fetched_at) "
+                    "SELECT CASE WHEN substr(path, 1, length(?1)) = ?1 THEN ?2 || substr(path, length(?1) + 1) "
+                    "ELSE path END, link, account, title, date, digest, codec, html, html_hash, converted, fetched_at "
+                    "FROM shard.snapshots", (old_prefix, new_prefix))
+                self.conn.commit()
+            finally:
+                self.conn.execute("DETACH DATABASE shard")
+
+def converter_key(legacy):
+    return f"{CONVERTER_VERSION}/{'legacy' if legacy else 'stream'}"
+
+def get_snapshot_store():
+    """返回全局快照库；html_snapshots 设为 false 时返回 None"""
+    global _snapshot_store
+    if not get_config().get("html_snapshots", True):
+        return None
+    with _session_lock:
+        if _snapshot_store is None or _snapshot_store.path != SNAPSHOT_DB_FILE:
+            _snapshot_store = SnapshotStore(SNAPSHOT_DB_FILE)
+        return _snapshot_store
+
+def snapshot_article(job, account, date_str, digest):
+    """下载后保存页面快照，保存失败不影响文章保存"""
+    snapshots = get_snapshot_store()
+    if snapshots is None:
+        return
+    fragment = js_content_fragment(job["html"])
+    if fragment is None:
+        return
+    try:
+        snapshots.put(job["filename"], job["url"], account, job["title"], date_str, digest, fragment)
+    except sqlite3.Error as e:
+        print(f"  [Snapshot] 保存快照失败 {job['filename']}: {e}")
+
+def convert_snapshot(record, codec, legacy=False):
+    """解压快照并转换为 Markdown，在转换进程中运行"""
+    return convert_article(decompress_record(record, codec).decode("utf-8"), legacy)
+
+def reconvert_snapshots(account=None, force=False):
+    """
+    用快照重新生成文章的 Markdown（转换进程池并行，进程数为 convert_processes，默认 CPU 核数）
+    转换器版本、转换方式和快照内容都没变化的文章跳过，force 时全部重新转换
+    返回 (重新转换数, 跳过数)
+    """
+    snapshots = get_snapshot_store()
+    if snapshots is None:
+        return 0, 0
+    config = get_config()
+    legacy = config.get("markdown_converter") == "legacy"
+    key = converter_key(legacy)
+    processes = int(config.get("convert_processes") or os.cpu_count() or 1)
+    pool = get_convert_pool(processes)
+    pending = deque()
+    converted = skipped = 0
+
+    def write(snapshot, future):
+        try:
+            body, timings = future.result()
+        except Exception as e:
+            print(f"  [Error] 转换失败 {snapshot['path']}: {e}")
+            return False
+        for stage, seconds in timings.items():
+            metrics.observe(stage, seconds)
+        path = snapshot["path"]
+        data = (markdown_header(snapshot["title"], snapshot["date"], snapshot["link"],
+                                snapshot["account"], snapshot["digest"]) + body).encode("utf-8")
+        # 文章已经保存过：只替换文件，不改状态、不重复通知；结果过小时保留原文件
+        if len(data) < config.get("min_file_size_kb", 3) * 1024:
+            print(f"  [Skip] 重新转换结果过小 ({len(data)} bytes)，保留原文件: {path}")
+            return False
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        part_path = path + ".part"
+        try:
+            with open(part_path, "wb") as f:
+                f.write(data)
+            install_article_file(part_path, path, config, data)
+            print(f"  [Reconverted] {path} ({len(data)} bytes)")
+        finally:
+            if os.path.exists(part_path):
+                os.remove(part_path)
+        snapshots.mark_converted(path, legacy)
+        return True
+
+    for path in snapshots.paths(account):
+        snapshot = snapshots.get(path)
+        if not force and snapshot["converted"] == f"{key}/{snapshot['html_hash']}":
+            skipped += 1
+            continue
+        # 排队的转换任务有上限，快照不会一次全部读入内存
+        if len(pending) >= processes * 2:
+            converted += write(*pending.popleft())
+        record = snapshot.pop("html")
+        pending.append((snapshot, pool.submit(convert_snapshot, record, snapshot["codec"], legacy)))
+    while pending:
+        converted += write(*pending.popleft())
+    return converted, skipped
+
+class JsonLinesSink:
+    """
+    把事件按行写成 JSON，追加到文件 path，或写入已打开的文件描述符 fd（如父进程传入的管道）
+    不支持标准输出：进度日志也输出到标准输出，两者会混在一起
+    """
+
+    def __init__(self, path=None, fd=None):
+        if (path is None) == (fd is None):
+            raise ValueError("需要且只能指定 path 或 fd 其中之一")
+        if path == "-":
+            raise ValueError("不支持输出到标准输出（会与进度日志混在一起），请指定文件路径或 fd")
+        self.name = "jsonl"
+        self.path = path
+        self.fd = fd
+
+    def send(self, events):
+        data = "".join(json.dumps(event, ensure_ascii=False) + "\n" for event in events)
+        if self.fd is not None:
+            view = memoryview(data.encode("utf-8"))
+            while view:
+                view = view[os.write(self.fd, view):]
+            return
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(data)
+
+    def close(self):
+        pass
+
+class WebhookSink:
+    """把一批事件以 {"events": [...]} 的形式 POST 到 url"""
+
+    def __init__(self, url, headers=None, timeout=5):
+        self.name = "webhook"
+        self.url = url
+        self.headers = headers or {}
+        self.timeout = timeout
+        self.session = requests.Session()
+
+    def send(self, events):
+        resp = self.session.post(self.url, json={"events": events}, headers=self.headers, timeout=self.timeout)
+        resp.raise_for_status()
+
+    def close(self):
+        self.session.close()
+
+class UnixSocketSink:
+    """通过本地 Unix 套接字发送事件，每个事件一行 JSON；连接断开时重连一次"""
+
+    def __init__(self, path, timeout=5):
+        if not hasattr(socket, "AF_UNIX"):
+            raise ValueError("当前系统不支持 Unix 套接字")
+        self.name = "unix"
+        self.path = path
+        self.timeout = timeout
+        self.sock = None
+
+    def send(self, events):
+        data = "".join(json.dumps(event, ensure_ascii=False) + "\n" for event in events).encode("utf-8")
+        for attempt in range(2):
+            try:
+                if self.sock is None:
+                    self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+                    self.sock.settimeout(self.timeout)
+                    self.sock.connect(self.path)
+                self.sock.sendall(data)
+                return
+            except OSError:
+                self.close()
+                if attempt:
+                    raise
+
+    def close(self):
+        if self.sock is not None:
+            self.sock.close()
+            self.sock = None
+
+class RedisSink:
+    """
+    把事件 RPUSH 到 Redis 列表（key），每个事件一条 JSON
+    只用到 RPUSH / AUTH / SELECT，任何兼容 RESP 协议的服务（包括本地桩服务）都可以接收
+    url 格式: redis://[:密码@]主机[:端口][/库号]
+    """
+
+    def __init__(self, url="redis://127.0.0.1:6379/0", key="wechat_crawler:events", timeout=5):
+        parsed = urlparse(url)
+        self.name = "redis"
+        self.host = parsed.hostname or "127.0.0.1"
+        self.port = parsed.port or 6379
+        self.password = parsed.password
+        self.db = int(parsed.path.strip("/") or 0)
+        self.key = key
+        self.timeout = timeout
+        self.sock = None
+        self.reader = None
+
+    def _command(self, *args):
+        parts = [b"*%d\r\n" % len(args)]
+        for arg in args:
+            data = arg if isinstance(arg, bytes) else str(arg).encode("utf-8")
+            parts.append(b"$%d\r\n%s\r\n" % (len(data), data))
+        self.sock.sendall(b"".join(parts))
+        line = self.reader.readline()
+        if not line:
+            raise ConnectionError("连接已关闭")
+        if line.startswith(b"-"):
+            raise RuntimeError(line[1:].strip().decode("utf-8", errors="replace"))
+        if line.startswith(b"$") and int(line[1:]) >= 0:
+            self.reader.read(int(line[1:]) + 2)
+        return line
+
+    def _connect(self):
+        self.sock = socket.create_connection((self.host, self.port), timeout=self.timeout)
+        self.reader = self.sock.makefile("rb")
+        if self.password:
+            self._command("AUTH", self.password)
+        if self.db:
+            self._command("SELECT", self.db)
+
+    def send(self, events):
+        values = [json.dumps(event, ensure_ascii=False) for event in events]
+        for attempt in range(2):
+            try:
+                if self.sock is None:
+                    self._connect()
+                self._command("RPUSH", self.key, *values)
+                return
+            except (OSError, ConnectionError):
+                self.close()
+                if attempt:
+                    raise
+
+    def close(self):
+        if self.sock is not None:
+            self.reader.close()
+            self.sock.close()
+            self.sock = None
+
+NOTIFY_SINKS = {
+    "jsonl": JsonLinesSink,
+    "webhook": WebhookSink,
+    "unix": UnixSocketSink,
+    "redis": RedisSink,
+}
+
+class Notifier:
+    """
+    新文章通知：文章列出（listed）和保存（saved）时把事件交给配置的接收端
+    - emit 只把事件放进有界队列，不等待发送；队列满时丢弃事件并计数，接收端再慢也不会拖住抓取
+    - 后台线程按批发送：攒够 batch_size 个事件或等待 flush_seconds 后发送一次
+    - 某个接收端发送失败只记录错误，不影响其他接收端
+    """
+
+    def __init__(self, sinks, batch_size=50, flush_seconds=1.0, queue_size=10000):
+        self.sinks = sinks
+        self.batch_size = max(1, batch_size)
+        self.flush_seconds = flush_seconds
+        self.queue = queue.Queue(maxsize=max(1, queue_size))
+        self.thread = threading.Thread(target=self._run, name="notifier", daemon=True)
+        self.thread.start()
+
+    def emit(self, event):
+        try:
+            self.queue.put_nowait(event)
+        except queue.Full:
+            metrics.inc("notify_dropped_total")
+
+    def _deliver(self, batch):
+        for sink in self.sinks:
+            try:
+                sink.send(batch)
+                metrics.inc("notify_events_total", len(batch), sink=sink.name)
+            except Exception as e:
+                print(f"[Notify] 发送到 {sink.name} 失败: {e}")
+                metrics.inc("notify_errors_total", sink=sink.name)
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            event = self.queue.get()
+            if event is None:
+                break
+            batch = [event]
+            deadline = time.monotonic() + self.flush_seconds
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    event = self.queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if event is None:
+                    stopping = True
+                    break
+                batch.append(event)
+            self._deliver(batch)
+        for sink in self.sinks:
+            sink.close()
+
+    def close(self, timeout=10):
+        """发送队列中剩余的事件后停止后台线程"""
+        try:
+            self.queue.put(None, timeout=timeout)
+        except queue.Full:
+            return
+        self.thread.join(timeout)
+
+def create_sink(spec):
+    spec = dict(spec)
+    kind = spec.pop("type", None)
+    if kind not in NOTIFY_SINKS:
+        raise ValueError(f"未知的通知类型: {kind}")
+    return NOTIFY_SINKS[kind](**spec)
+
+def get_notifier():
+    """根据 notify_sinks 配置返回全局通知器，没有配置接收端时返回 None"""
+    global _notifier
+    config = get_config()
+    specs = config.get("notify_sinks")
+    if not specs:
+        return None
+    with _session_lock:
+        if _notifier is None:
+            sinks = []
+            for spec in specs:
+                try:
+                    sinks.append(create_sink(spec))
+                except (TypeError, ValueError) as e:
+                    print(f"[Notify] 接收端配置无效 {spec}: {e}")
+            _notifier = Notifier(sinks, int(config.get("notify_batch_size", 50)),
+                                 float(config.get("notify_flush_seconds", 1.0)),
+                                 int(config.get("notify_queue_size", 10000)))
+            atexit.register(_notifier.close)
+        return _notifier
+
+def notify(event, **fields):
+    """发出一个通知事件，未配置接收端时什么也不做"""
+    notifier = get_notifier()
+    if notifier is not None:
+        notifier.emit(dict(fields, event=event, time=int(time.time())))
+
+def notify_listed(fakeid, account_name, articles):
+    for article in articles:
+        notify("listed", link=article.get("link"), title=article.get("title"), account=account_name,
+               fakeid=fakeid, create_time=article.get("create_time"), digest=article.get("digest", ""))
+
+class AccountScheduler:
+    """
+    每个公众号独立的检查时间表
+    根据观察到的发文间隔自适应调整检查频率：经常更新的号检查得勤，长期不更新的号检查得少
+    状态保存在 SCHEDULE_FILE 中，重启后沿用
+    """
+
+    def __init__(self, base_interval, min_interval, max_interval, state=None):
+        self.base_interval = base_interval
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.state = state or {}
+        self.lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, config):
+        return cls(
+            base_interval=config.get("check_interval_minutes", 60) * 60,
+            min_interval=config.get("min_check_interval_minutes", 15) * 60,
+            max_interval=config.get("max_check_interval_minutes", 1440) * 60,
+            state=load_json(SCHEDULE_FILE),
+        )
+
+    def save(self):
+        with self.lock:
+            save_json(SCHEDULE_FILE, self.state)
+
+    def is_due(self, fakeid, now=None):
+        now = now or time.time()
+        with self.lock:
+            return self.state.get(fakeid, {}).get("next_check", 0) <= now
+
+    def next_due_time(self, fakeids):
+        with self.lock:
+            return min((self.state.get(f, {}).get("next_check", 0) for f in fakeids), default=0)
+
+    def defer(self, fakeid, seconds):
+        """获取失败时在 seconds 秒后重试，不改变已估算的发文间隔"""
+        with self.lock:
+            self.state.setdefault(fakeid, {})["next_check"] = time.time() + seconds
+
+    def record(self, fakeid, publish_times, now=None):
+        """
+        根据本次看到的发文时间更新该号的平均发文间隔和下次检查时间
+        """
+        now = now or time.time()
+        with self.lock:
+            entry = self.state.setdefault(fakeid, {})
+            times = sorted({t for t in publish_times if t}, reverse=True)
+            if len(times) >= 2:
+                gap = (times[0] - times[-1]) / (len(times) - 1)
+                old_gap = entry.get("avg_gap")
+                entry["avg_gap"] = gap if old_gap is None else 0.7 * old_gap + 0.3 * gap
+            if times:
+                entry["last_publish"] = max(times[0], entry.get("last_publish", 0))
+
+            avg_gap = entry.get("avg_gap")
+            interval = avg_gap / 4 if avg_gap else self.base_interval
+            last_publish = entry.get("last_publish")
+            if last_publish and avg_gap and now - last_publish > avg_gap:
+                # 超过平均间隔仍未更新，视为休眠，逐渐拉长检查间隔
+                interval = max(interval, (now - last_publish) / 2)
+            interval = min(self.max_interval, max(self.min_interval, interval))
+            entry["interval"] = int(interval)
+            entry["next_check"] = now + interval
+
+def article_position(article):
+    """文章在发布时间线上的位置 (发布时间, msgid)，用于和水位线比较"""
+    return (article.get("create_time") or 0, article.get("msgid") or 0)
+
+def fetch_new_articles(fakeid, token, cookie, watermark=None, stop_link=None, stop_title=None,
+                       begin=0, newest=None, on_page=None):
+    """
+    从最新一页开始翻页，遇到不晚于水位线的文章立即停止
+    有水位线时，没有新文章的公众号只需请求一次接口
+    没有水位线时（首次爬取或旧数据）退回按链接/标题匹配停止
+    begin/newest 用于从上次中断的翻页进度继续
+    每处理完一页调用 on_page(本页新文章, 下一页 begin, 最新位置)，翻页结束时下一页 begin 为 None
+    返回 (新文章列表, 本次看到的最新位置, 错误码)
+    """
+    count = LIST_PAGE_SIZE
+    new_articles = []
+
+    while True:
+        articles, total, error = get_articles(fakeid, token, cookie, begin, count)
+        if error is not None:
+            return new_articles, newest, error
+        page_articles, newest, next_begin = scan_page(articles, begin, count, newest, watermark,
+                                                      stop_link, stop_title)
+        new_articles.extend(page_articles)
+        if on_page:
+            on_page(page_articles, next_begin, newest)
+        if next_begin is None:
+            break
+        begin = next_begin
+    return new_articles, newest, None
+
+def scan_page(articles, begin, count, newest, watermark=None, stop_link=None, stop_title=None):
+    """
+    检查一页文章列表（fetch_new_articles 和异步引擎共用）
+    返回 (本页新文章, 最新位置, 下一页 begin)，需要停止翻页时下一页 begin 为 None
+    """
+    if not articles:
+        return [], newest, None
+    print(f"  获取到 {len(articles)} 篇文章 (当前进度: {begin})")
+
+    page_articles = []
+    for article in articles:
+        position = article_position(article)
+        if newest is None or position > newest:
+            newest = position
+        if watermark is not None:
+            if position <= watermark:
+                print(f"  [Stop] 到达上次水位线，停止翻页: {article.get('title')}")
+                return page_articles, newest, None
+        elif (stop_link and article.get("link") == stop_link) or \
+                (stop_title and article.get("title") == stop_title):
+            print(f"  [Stop] 找到已存档文章，停止爬取: {article.get('title')}")
+            return page_articles, newest, None
+        page_articles.append(article)
+
+    if len(articles) < count:
+        print("  已到达最后一页")
+        return page_articles, newest, None
+    return page_articles, newest, begin + count
+
+def format_account_log(account_name, articles):
+    """按 wx_poc.txt 的格式生成一个公众号的日志段落"""
+    lines = [
+        "=" * 60,
+        f"公众号：{account_name}",
+        f"文章数量：{len(articles)}篇",
+        f"第一篇文章：{articles[0].get('title')}",
+        f"第一篇文章链接：{articles[0].get('link')}",
+        "=" * 60,
+    ]
+    for article in articles:
+        lines.append(f"文章名字：{article.get('title')}")
+        lines.append(f"文章链接：{article.get('link')}")
+        lines.append("-" * 50)
+    return "\n".join(lines) + "\n"
+
+LOG_SEPARATOR = "-" * 50 + "\n"
+
+def repair_log_tail(path, committed_size=None):
+    """
+    截掉 wx_poc.txt 末尾上次追加写入中途崩溃留下的内容，返回截掉的字节数
+    committed_size 为状态库记录的上一批写入并 fsync 后的文件大小，之后的内容对应的文章都还没有标记为已记录，全部截掉；
+    没有记录时（旧版本写的日志）按段落格式截掉末尾不完整的段落
+    截掉的文章在状态库中仍是未记录，会重新写入日志
+    """
+    if not os.path.exists(path):
+        return 0
+    with open(path, "r+b") as f:
+        size = f.seek(0, os.SEEK_END)
+        if committed_size is not None:
+            # 文件比记录的小说明被替换或清空过，不做处理
+            keep = min(committed_size, size)
+        else:
+            keep = complete_log_size(f, size)
+        if keep >= size:
+            return 0
+        f.truncate(keep)
+        f.flush()
+        os.fsync(f.fileno())
+    return size - keep
+
+def complete_log_size(f, size):
+    """按段落格式找出日志中最后一个完整段落的结尾，无法识别的内容保持原样"""
+    separator = LOG_SEPARATOR.encode("utf-8")
+    block_start = ("\n" + "=" * 60 + "\n公众号：").encode("utf-8")
+    window = 64 * 1024
+    while size:
+        start = max(0, size - window)
+        f.seek(start)
+        data = f.read(size - start)
+        if data.endswith(separator):
+            return size
+        pos = data.rfind(separator)
+        keep = pos + len(separator) if pos != -1 else 0
+        if pos != -1 or start == 0:
+            # 分隔线之后是新段落的开头（写了一半的标题），截到分隔线处
+            if data[keep:keep + 1] == b"=":
+                return start + keep
+            # 写了一半的段落已有部分文章，截到该段落开头
+            block_pos = data.rfind(block_start, 0, keep)
+            if block_pos != -1:
+                return start + block_pos + 1
+            if start == 0:
+                # 文件中只有一个写了一半的段落
+                return 0 if data.startswith(block_start[1:]) else size
+        window *= 2
+    return size
+
+class LogWriter:
+    """
+    wx_poc.txt 的批量写入
+    - 日志段落先缓存在内存中，累计 batch_size 篇文章或调用 flush 时一次追加写入并 fsync
+    - fsync 之后才在状态库中把文章标记为已记录；进程中途退出时，缓存中和写了一半的段落会在下次重新写入
+    - 每批写入后在状态库中记录文件大小，第一次写入前截掉该大小之后的内容（上次崩溃时写了一半的批次），
+      日志中不会出现半条记录
+    """
+
+    def __init__(self, path, state_store, batch_size=200):
+        self.path = path
+        self.state = state_store
+        self.batch_size = max(1, batch_size)
+        self.lock = threading.RLock()
+        self.pending = []
+        self.pending_links = set()
+        self.repaired = False
+
+    def is_pending(self, link):
+        with self.lock:
+            return link in self.pending_links
+
+    def add(self, text, links):
+        with self.lock:
+            self.pending.append(text)
+            self.pending_links.update(links)
+            if len(self.pending_links) >= self.batch_size:
+                self.flush()
+
+    def flush(self):
+        """写入缓存的段落，返回写入的文章数"""
+        with self.lock:
+            if not self.pending:
+                return 0
+            if not self.repaired:
+                dropped = repair_log_tail(self.path, self.state.get_log_size(self.path))
+                if dropped:
+                    print(f"[Log] 已截掉 {self.path} 末尾不完整的记录 ({dropped} 字节)")
+                self.repaired = True
+            with open(self.path, "ab") as f:
+                f.write("".join(self.pending).encode("utf-8"))
+                f.flush()
+                os.fsync(f.fileno())
+                size = f.tell()
+            links = list(self.pending_links)
+            # 标记已记录和记录文件大小在同一事务中，下次启动时大小之后的内容都可以安全截掉
+            self.state.mark_logged(links, self.path, size)
+            self.pending = []
+            self.pending_links = set()
+            return len(links)
+
+def get_log_writer():
+    """返回全局日志写入器，OUTPUT_FILE 切换（分片）时先写入旧文件的缓存"""
+    global _log_writer
+    state = get_state_store()
+    with _session_lock:
+        writer = _log_writer
+        if writer is None or writer.path != OUTPUT_FILE or writer.state is not state:
+            _log_writer = LogWriter(OUTPUT_FILE, state, int(get_config().get("log_batch_size", 200)))
+    if writer is not None and writer is not _log_writer:
+        writer.flush()
+    return _log_writer
+
+def flush_log():
+    """把缓存的日志写入 wx_poc.txt，每轮检查结束和程序退出前调用"""
+    if _log_writer is not None:
+        _log_writer.flush()
+
+def write_account_log(fakeid, account_name):
+    """
+    把状态库中该公众号尚未记录的文章加入 wx_poc.txt 的写入缓存
+    包括上次中断前已列出、还没写日志的文章；批量写入磁盘后标记为已记录
+    多个公众号并发处理时由日志写入器的锁串行化
+    """
+    writer = get_log_writer()
+    store = writer.state
+    with writer.lock:
+        articles = [a for a in store.unlogged_articles(fakeid) if not writer.is_pending(a["link"])]
+        if not articles:
+            return
+        store.update_account(fakeid, account=account_name,
+                             first_title=articles[0].get("title"), first_link=articles[0].get("link"))
+        writer.add(format_account_log(account_name, articles), [a["link"] for a in articles])
+
+def valid_articles_only(articles):
+    """过滤掉已删除或失效的文章"""
+    valid = []
+    for article in articles:
+        if is_valid_article_link(article.get("link")):
+            valid.append(article)
+        else:
+            print(f"  [Skip] 文章已失效，跳过: {article.get('title')}")
+            metrics.inc("invalid_links_total")
+    return valid
+
+def start_archive_listing(fakeid, account_name):
+    """
+    读取水位线和上次中断的翻页进度，返回 fetch_new_articles 的翻页参数
+    每页文章和翻页进度通过 on_page 一起落库，进程中断后不需要重新翻页
+    """
+    store = get_state_store()
+    account = store.get_account(fakeid)
+    watermark = store.get_watermark(fakeid)
+    begin, newest = 0, None
+    progress = store.get_progress(fakeid)
+    if progress is not None:
+        begin, newest = progress
+        print(f"  [Resume] 从上次中断的位置继续翻页 (当前进度: {begin})")
+    elif watermark is None:
+        print(f"  [New] 无水位线记录，按第一篇文章链接判断: {account_name}")
+
+    def on_page(page_articles, next_begin, page_newest):
+        valid = valid_articles_only(page_articles)
+        if next_begin is None:
+            inserted = store.add_articles(fakeid, account_name, valid)
+        else:
+            inserted = store.save_page(fakeid, account_name, valid, next_begin, page_newest)
+        notify_listed(fakeid, account_name, inserted)
+
+    return {"watermark": watermark, "stop_link": account.get("first_link"),
+            "begin": begin, "newest": newest, "on_page": on_page}
+
+def finish_archive_listing(fakeid, account_name, listing, new_articles, newest):
+    """
+    翻页完成后推进水位线并写日志
+    返回 (本次看到的文章发布时间列表, 待保存的文章)，待保存的文章包括上次中断时已列出但没保存的
+    """
+    store = get_state_store()
+    watermark = listing["watermark"]
+    publish_times = [a.get("create_time") for a in new_articles]
+    if newest is not None:
+        publish_times.append(newest[0])
+    if not new_articles and listing["begin"] == 0:
+        print(f"  [Skip] 没有新文章: {account_name}")
+
+    store.finish_listing(fakeid, newest if newest is not None and (watermark is None or newest > watermark)
+                         else None)
+    write_account_log(fakeid, account_name)
+    return publish_times, articles_to_save(fakeid)
+
+def archive_account(idx, fakeid, token, cookie, account_names, headers):
+    """
+    存档单个公众号
+    返回本次看到的文章发布时间列表（供调度器估算发文频率），获取失败时返回 None
+    """
+    account_name = account_names.get(idx, "Unknown_Account")
+    print(f"正在处理 fakeid: {fakeid} ({account_name})")
+    listing = start_archive_listing(fakeid, account_name)
+    new_articles, newest, error = fetch_new_articles(fakeid, token, cookie, **listing)
+    if error is not None:
+        # 列表获取中途失败时不推进水位线，已列出的页保留在进度中，下轮从断点继续
+        print(f"  获取失败 (错误: {error})，本轮跳过该公众号")
+        return None
+    publish_times, pending = finish_archive_listing(fakeid, account_name, listing, new_articles, newest)
+    if pending:
+        save_articles(pending, headers, account_name)
+    return publish_times
+
+def mode_archive(fakeids, token, cookie, account_names, scheduler=None):
+    """
+    存档模式：爬取所有文章
+    多个公众号并发处理（account_workers 控制并发数）
+    传入 scheduler 时只处理到期的公众号，并根据结果安排下次检查时间
+    """
+    if get_config().get("engine") == "async":
+        return mode_archive_async(fakeids, token, cookie, account_names, scheduler)
     print("--- 启动存档模式 ---")
     headers = get_headers(cookie, token)
-    
-    # Load existing links from wx_poc.txt to avoid duplicates
-    existing_links = set()
-    if os.path.exists(OUTPUT_FILE):
-        with open(OUTPUT_FILE, "r", encoding="utf-8") as f:
-            for line in f:
-                if line.startswith("文章链接："):
-                    link = line.strip().replace("文章链接：", "")
-                    existing_links.add(link)
-    
-    # Load first articles from wx_poc.txt for comparison
-    account_first_articles = load_account_first_article_from_txt()
-    print(f"已加载 {len(account_first_articles)} 个公众号的第一篇文章记录")
+    # 已存档链接和各公众号第一篇文章从状态库按索引查询，不再全量读取 wx_poc.txt
+    get_state_store()
     
     # Create base directory if not exists
     if not os.path.exists(ARTICLES_BASE_DIR):
         os.makedirs(ARTICLES_BASE_DIR)
-    
-    for idx, fakeid in enumerate(fakeids):
-        account_name = account_names.get(idx, "Unknown_Account")
-        print(f"正在处理 fakeid: {fakeid} ({account_name})")
-        
-        # Get first article to check if already archived
-        articles_first, _, _ = get_articles(fakeid, token, cookie, 0, 1)
-        if articles_first:
-            first_article_link = articles_first[0].get('link')
-            
-            # Check if this account has archived articles in wx_poc.txt
-            if account_name in account_first_articles:
-                archived_first_link = account_first_articles[account_name]
-                if first_article_link == archived_first_link:
-                    print(f"  [Skip] 公众号第一篇文章已存档，跳过: {account_name}")
-                    continue
-                else:
-                    print(f"  [New] 发现新内容，开始爬取: {account_name}")
-            else:
-                print(f"  [New] 首次爬取，开始处理: {account_name}")
-        
-        begin = 0
-        count = 10
-        should_stop = False
-        account_articles = []
-        
-        while not should_stop:
-            articles, total, _ = get_articles(fakeid, token, cookie, begin, count)
-            if not articles:
-                print(f"  没有更多文章或获取失败")
-                break
-                
-            print(f"  获取到 {len(articles)} 篇文章 (当前进度: {begin})")
-            
-            for article in articles:
-                link = article.get('link')
-                # Check if this article is already archived in wx_poc.txt
-                if account_name in account_first_articles:
-                    if link == account_first_articles[account_name]:
-                        print(f"  [Stop] 找到已存档文章，停止爬取: {article.get('title')}")
-                        should_stop = True
-                        break
-                # Skip invalid articles (deleted or expired)
-                if not is_valid_article_link(link):
-                    print(f"  [Skip] 文章已失效，跳过: {article.get('title')}")
-                    continue
-                # Only collect if not already archived
-                if link not in existing_links:
-                    account_articles.append(article)
-            
-            if should_stop:
-                break
-                
-            if len(articles) < count:
-                print("  已到达最后一页")
-                break
-                
-            begin += count
-            time.sleep(3)
+
+    accounts = [(idx, fakeid) for idx, fakeid in enumerate(fakeids)
+                if scheduler is None or scheduler.is_due(fakeid)]
+    if scheduler is not None:
+        print(f"本轮到期的公众号: {len(accounts)}/{len(fakeids)}")
+
+    def run(idx, fakeid):
+        try:
+            publish_times = archive_account(idx, fakeid, token, cookie, account_names, headers)
+        except Exception as e:
+            print(f"  [Error] 处理 {fakeid} 失败: {e}")
+            publish_times = None
+        if scheduler is None:
+            return
+        if publish_times is None:
+            scheduler.defer(fakeid, retry_seconds)
+        else:
+            scheduler.record(fakeid, publish_times)
+
+    config = get_config()
+    workers = max(1, int(config.get("account_workers", DEFAULT_ACCOUNT_WORKERS)))
+    retry_seconds = config.get("retry_interval_minutes", 5) * 60
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for idx, fakeid in accounts:
+            executor.submit(run, idx, fakeid)
+
+    flush_log()
+    if scheduler is not None:
+        scheduler.save()
+
+def update_listing(fakeid, history):
+    """读取更新模式的历史记录，返回 fetch_new_articles 的翻页参数"""
+    last_article_info = history.get(fakeid, {})
+    watermark = None
+    if last_article_info.get("watermark_time") is not None:
+        watermark = (last_article_info["watermark_time"], last_article_info.get("watermark_msgid", 0))
+    return {"watermark": watermark, "stop_title": last_article_info.get("last_article_title")}
+
+def record_update_articles(fakeid, account_name, new_articles):
+    """过滤失效文章并写入状态库和日志，返回需要保存的文章"""
+    valid_articles = valid_articles_only(new_articles)
+
+    if valid_articles:
+        print(f"  发现 {len(valid_articles)} 篇新文章")
         
-        # Save to txt with account header
-        if account_articles:
-            # Filter out invalid articles before saving
-            valid_articles = [a for a in account_articles if is_valid_article_link(a.get('link'))]
-            
-            if valid_articles:
-                with open(OUTPUT_FILE, "a+", encoding="utf-8") as f:
-                    f.write("=" * 60 + "\n")
-                    f.write(f"公众号：{account_name}\n")
-                    f.write(f"文章数量：{len(valid_articles)}篇\n")
-                    f.write(f"第一篇文章：{valid_articles[0].get('title')}\n")
-                    f.write(f"第一篇文章链接：{valid_articles[0].get('link')}\n")
-                    f.write("=" * 60 + "\n")
-                    for article in valid_articles:
-                        f.write(f"文章名字：{article.get('title')}\n")
-                        f.write(f"文章链接：{article.get('link')}\n")
-                        f.write("-" * 50 + "\n")
-                        existing_links.add(article.get('link'))
-                
-                # Save to Markdown (only valid articles)
-                for article in valid_articles:
-                    save_url_to_md(article, headers, account_name)
+        # Save to txt log with account header (new format)
+        inserted = get_state_store().add_articles(fakeid, account_name, valid_articles)
+        notify_listed(fakeid, account_name, inserted)
+        write_account_log(fakeid, account_name)
+    elif new_articles:
+        print("  发现的新文章均已失效")
+    else:
+        print("  无新文章")
+    return valid_articles
+
+def advance_update_history(fakeid, history, listing, newest, valid_articles):
+    """
+    Update history with the NEWEST article
+    列表获取不完整时不调用，保留旧记录，下次从旧位置继续
+    """
+    watermark = listing["watermark"]
+    if newest is None or (watermark is not None and newest <= watermark):
+        return
+    entry = dict(history.get(fakeid, {}), watermark_time=newest[0], watermark_msgid=newest[1])
+    if valid_articles:
+        entry["last_article_title"] = valid_articles[0].get("title")
+        entry["last_article_url"] = valid_articles[0].get("link")
+    history[fakeid] = entry
+    store = get_state_store()
+    store.set_watermark(fakeid, newest)
+    store.update_account(fakeid, last_title=entry.get("last_article_title"),
+                         last_url=entry.get("last_article_url"))
 
 def mode_update(fakeids, token, cookie, history, account_names):
     """更新模式：增量爬取"""
+    if get_config().get("engine") == "async":
+        return mode_update_async(fakeids, token, cookie, history, account_names)
     print("--- 启动更新模式 ---")
     headers = get_headers(cookie, token)
     
-    # Load existing links to avoid duplicates
-    existing_links = set()
-    if os.path.exists(OUTPUT_FILE):
-        with open(OUTPUT_FILE, "r", encoding="utf-8") as f:
-            for line in f:
-                if line.startswith("文章链接："):
-                    link = line.strip().replace("文章链接：", "")
-                    existing_links.add(link)
-    
     for idx, fakeid in enumerate(fakeids):
         account_name = account_names.get(idx, "Unknown_Account")
         print(f"正在检查 fakeid: {fakeid} ({account_name})")
         
-        last_article_info = history.get(fakeid, {})
-        last_title = last_article_info.get("last_article_title")
-        
-        begin = 0
-        count = 10
-        new_articles = []
-        found_overlap = False
-        
-        while not found_overlap:
-            articles, total, _ = get_articles(fakeid, token, cookie, begin, count)
-            if not articles:
-                break
-                
-            for article in articles:
-                title = article.get("title")
-                link = article.get('link')
-                
-                if title == last_title:
-                    print(f"  找到上次最后更新的文章: {title}，停止本号更新")
-                    found_overlap = True
-                    break
-                
-                # Skip invalid articles (deleted or expired)
-                if not is_valid_article_link(link):
-                    print(f"  [Skip] 文章已失效，跳过: {title}")
-                    continue
-                
-                new_articles.append(article)
-            
-            if len(articles) < count or found_overlap:
-                break
-                
-            begin += count
-            time.sleep(3)
-            
-        if new_articles:
-            # Filter out invalid articles
-            valid_articles = [a for a in new_articles if is_valid_article_link(a.get('link'))]
-            
-            if valid_articles:
-                print(f"  发现 {len(valid_articles)} 篇新文章")
-                
-                # Save to txt log with account header (new format)
-                with open(OUTPUT_FILE, "a+", encoding="utf-8") as f:
-                    f.write("=" * 60 + "\n")
-                    f.write(f"公众号：{account_name}\n")
-                    f.write(f"文章数量：{len(valid_articles)}篇\n")
-                    f.write(f"第一篇文章：{valid_articles[0].get('title')}\n")
-                    f.write(f"第一篇文章链接：{valid_articles[0].get('link')}\n")
-                    f.write("=" * 60 + "\n")
-                    for article in valid_articles:
-                        f.write(f"文章名字：{article.get('title')}\n")
-                        f.write(f"文章链接：{article.get('link')}\n")
-                        f.write("-" * 50 + "\n")
-                        existing_links.add(article.get('link'))
-                
-                # Process new articles (Save to MD)
-                for article in valid_articles:
-                    save_url_to_md(article, headers, account_name)
-                
-                # Update history with the NEWEST article
-                newest = valid_articles[0]
-                history[fakeid] = {
-                    "last_article_title": newest.get("title"),
-                    "last_article_url": newest.get("link")
-                }
-            else:
-                print("  发现的新文章均已失效")
+        listing = update_listing(fakeid, history)
+        new_articles, newest, error = fetch_new_articles(fakeid, token, cookie, **listing)
+        failed = error is not None
+        if failed:
+            print(f"  获取失败 (错误: {error})，本轮不更新历史记录")
+
+        valid_articles = record_update_articles(fakeid, account_name, new_articles)
+        # Process new articles (Save to MD)，连同此前失败待重试的文章
+        pending = articles_to_save(fakeid)
+        if pending:
+            save_articles(pending, headers, account_name)
+
+        if not failed:
+            advance_update_history(fakeid, history, listing, newest, valid_articles)
+
+    flush_log()
+    save_json(HISTORY_FILE, history)
+
+class AsyncResponse(CachedResponse):
+    """aiohttp/httpx 响应读出后的结果，接口与 requests.Response 的常用部分相同"""
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.HTTPError(f"{self.status_code} for url: {self.url}")
+
+class AsyncHttpClient:
+    """
+    异步引擎的 HTTP 客户端，在一个事件循环中同时进行大量请求
+    - 依次使用 aiohttp、httpx；都未安装或开启了 http_cache 时，在线程池中调用 requests（复用连接池和磁盘缓存）
+    - 文章页面按主机限制并发（per_host_concurrency），总并发由 max_in_flight 限制
+    - 列表接口请求在占用并发名额之前等待共享限速器的令牌，退避期间不占用名额和线程
+    """
+
+    def __init__(self, max_in_flight, per_host):
+        self.max_in_flight = max_in_flight
+        self.per_host = per_host
+        self.host_slots = {}
+        self.in_flight = asyncio.Semaphore(max_in_flight)
+        if get_http_cache() is None and aiohttp is not None:
+            self.backend = "aiohttp"
+        elif get_http_cache() is None and httpx is not None:
+            self.backend = "httpx"
+        else:
+            self.backend = "requests"
+        self.session = None
+        self.executor = None
+
+    async def __aenter__(self):
+        if self.backend == "aiohttp":
+            self.session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.max_in_flight),
+                timeout=aiohttp.ClientTimeout(total=30))
+        elif self.backend == "httpx":
+            self.session = httpx.AsyncClient(
+                timeout=30, limits=httpx.Limits(max_connections=self.max_in_flight))
         else:
-            print("  无新文章")
+            get_session(self.max_in_flight)
+            self.executor = ThreadPoolExecutor(max_workers=self.max_in_flight)
+        return self
+
+    async def __aexit__(self, *exc):
+        if self.backend == "aiohttp":
+            await self.session.close()
+        elif self.backend == "httpx":
+            await self.session.aclose()
+        else:
+            self.executor.shutdown(wait=True)
+
+    def host_slot(self, url):
+        host = urlparse(url).netloc
+        slot = self.host_slots.get(host)
+        if slot is None:
+            slot = self.host_slots[host] = asyncio.Semaphore(self.per_host)
+        return slot
+
+    async def _get(self, url, headers, params, ttl, cacheable):
+        if self.backend == "requests":
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(
+                self.executor, functools.partial(cached_get, url, headers, params, ttl, cacheable))
+        if self.backend == "aiohttp":
+            async with self.session.get(url, headers=headers, params=params) as resp:
+                content = await resp.read()
+                return AsyncResponse(str(resp.url), resp.status, dict(resp.headers), content), False
+        resp = await self.session.get(url, headers=headers, params=params)
+        return AsyncResponse(str(resp.url), resp.status_code, dict(resp.headers), resp.content), False
+
+    async def get(self, url, headers, params=None, ttl=0, cacheable=None, limiter=None):
+        """
+        GET 请求，返回 (响应, 是否来自缓存)
+        传入 limiter 的是列表接口请求，和同步版本一样不受单主机并发限制
+        """
+        if limiter is not None:
+            # 先拿令牌再占用并发名额：限速退避可能长达几分钟，期间文章下载不受影响
+            cache = get_http_cache()
+            if cache is None or not cache.is_fresh(url, params, ttl):
+                await limiter.acquire_async()
+            async with self.in_flight:
+                return await self._get(url, headers, params, ttl, cacheable)
+        async with self.in_flight:
+            async with self.host_slot(url):
+                return await self._get(url, headers, params, ttl, cacheable)
+
+async def async_get_articles(client, fakeid, token, cookie, begin=0, count=LIST_PAGE_SIZE):
+    """get_articles 的异步版本，限速、重试和退避规则相同"""
+    url = f"{MP_BASE_URL}/cgi-bin/appmsgpublish"
+    headers = get_headers(cookie, token)
+    limiter = get_rate_limiter()
+    max_retries = get_config().get("api_max_retries", 5)
+    list_ttl = get_config().get("http_cache_list_ttl_seconds", 300)
+    params = list_params(fakeid, token, begin, count)
+
+    error = None
+    for attempt in range(max_retries + 1):
+        if attempt:
+            limiter.on_retry()
+        try:
+            with metrics.timer("list_fetch"):
+                response, from_cache = await client.get(url, headers, params, ttl=list_ttl,
+                                                        cacheable=is_cacheable_list_response, limiter=limiter)
+                response.raise_for_status()
+                data = decode_json(response.content)
+        except CacheMiss:
+            print(f"  [Cache] 离线模式下缓存未命中: {fakeid} begin={begin}")
+            metrics.inc("api_errors_total", ret="cache_miss")
+            return [], 0, "cache_miss"
+        except Exception as e:
+            print(f"请求失败: {e}")
+            metrics.inc("api_errors_total", ret="network")
+            error = "network"
+            await asyncio.sleep(min(60, 2 ** attempt))
+            continue
+
+        articles, total_count, error, retry = check_list_response(data, limiter, from_cache)
+        if not retry:
+            return articles, total_count, error
 
+    print(f"  重试 {max_retries} 次后仍然失败: {error}")
+    return [], 0, error
+
+async def async_fetch_new_articles(client, fakeid, token, cookie, watermark=None, stop_link=None,
+                                   stop_title=None, begin=0, newest=None, on_page=None):
+    """fetch_new_articles 的异步版本，参数和返回值相同"""
+    count = LIST_PAGE_SIZE
+    new_articles = []
+
+    while True:
+        articles, total, error = await async_get_articles(client, fakeid, token, cookie, begin, count)
+        if error is not None:
+            return new_articles, newest, error
+        page_articles, newest, next_begin = scan_page(articles, begin, count, newest, watermark,
+                                                      stop_link, stop_title)
+        new_articles.extend(page_articles)
+        if on_page:
+            on_page(page_articles, next_begin, newest)
+        if next_begin is None:
+            break
+        begin = next_begin
+    return new_articles, newest, None
+
+async def async_save_articles(client, articles, headers, account_name, config):
+    """
+    异步下载文章页面，转换交给 convert_processes 进程池（未配置时用线程），写盘在线程中进行
+    同时在下载、转换和写入的文章最多 convert_queue_size 篇，已下载的页面不会无限堆积在内存中
+    """
+    loop = asyncio.get_running_loop()
+    legacy = config.get("markdown_converter") == "legacy"
+    processes = int(config.get("convert_processes") or 0)
+    converter = get_convert_pool(processes) if processes else None
+    ttl = config.get("http_cache_article_ttl_seconds", 7 * 86400)
+    queue_size = max(1, int(config.get("convert_queue_size", (processes or os.cpu_count() or 1) * 2)))
+    slots = asyncio.Semaphore(queue_size)
+
+    async def save(article):
+        date_str = article_date_str(article)
+        if not article.get("link") or skip_before_fetch(article, account_name, date_str):
+            return
+        async with slots:
+            try:
+                with metrics.timer("page_fetch"):
+                    resp, _ = await client.get(article["link"], headers, ttl=ttl, cacheable=has_article_content)
+                resp.raise_for_status()
+                resp.encoding = "utf-8"
+                job = prepare_article(article, account_name, date_str, resp.text)
+                if job is None:
+                    return
+                body, timings = await loop.run_in_executor(converter, convert_article, job.pop("html"), legacy)
+                record_converted(job["url"], timings)
+                await loop.run_in_executor(None, write_article, job, body, config)
+            except Exception as e:
+                article_failed(article, e)
+
+    await asyncio.gather(*(save(article) for article in articles))
+
+async def async_archive_account(client, idx, fakeid, token, cookie, account_names, headers):
+    """archive_account 的异步版本"""
+    account_name = account_names.get(idx, "Unknown_Account")
+    print(f"正在处理 fakeid: {fakeid} ({account_name})")
+    listing = start_archive_listing(fakeid, account_name)
+    new_articles, newest, error = await async_fetch_new_articles(client, fakeid, token, cookie, **listing)
+    if error is not None:
+        print(f"  获取失败 (错误: {error})，本轮跳过该公众号")
+        return None
+    publish_times, pending = finish_archive_listing(fakeid, account_name, listing, new_articles, newest)
+    if pending:
+        await async_save_articles(client, pending, headers, account_name, get_config())
+    return publish_times
+
+def async_client_from_config(config):
+    return AsyncHttpClient(
+        max_in_flight=max(1, int(config.get("async_max_in_flight", DEFAULT_ASYNC_MAX_IN_FLIGHT))),
+        per_host=max(1, int(config.get("per_host_concurrency", DEFAULT_PER_HOST_CONCURRENCY))))
+
+def mode_archive_async(fakeids, token, cookie, account_names, scheduler=None):
+    """
+    存档模式的异步引擎（engine 设为 async 时使用）
+    所有到期公众号的翻页和文章下载在同一个事件循环中交替进行，共享列表接口限速
+    """
+    print("--- 启动存档模式（异步引擎）---")
+    headers = get_headers(cookie, token)
+    get_state_store()
+    os.makedirs(ARTICLES_BASE_DIR, exist_ok=True)
+
+    accounts = [(idx, fakeid) for idx, fakeid in enumerate(fakeids)
+                if scheduler is None or scheduler.is_due(fakeid)]
+    if scheduler is not None:
+        print(f"本轮到期的公众号: {len(accounts)}/{len(fakeids)}")
+    config = get_config()
+    retry_seconds = config.get("retry_interval_minutes", 5) * 60
+
+    async def run_all():
+        async with async_client_from_config(config) as client:
+            print(f"HTTP 客户端: {client.backend}")
+
+            async def run(idx, fakeid):
+                try:
+                    publish_times = await async_archive_account(
+                        client, idx, fakeid, token, cookie, account_names, headers)
+                except Exception as e:
+                    print(f"  [Error] 处理 {fakeid} 失败: {e}")
+                    publish_times = None
+                if scheduler is None:
+                    return
+                if publish_times is None:
+                    scheduler.defer(fakeid, retry_seconds)
+                else:
+                    scheduler.record(fakeid, publish_times)
+
+            await asyncio.gather(*(run(idx, fakeid) for idx, fakeid in accounts))
+
+    asyncio.run(run_all())
+    flush_log()
+    if scheduler is not None:
+        scheduler.save()
+
+def mode_update_async(fakeids, token, cookie, history, account_names):
+    """更新模式的异步引擎：各公众号同时检查，历史记录规则与 mode_update 相同"""
+    print("--- 启动更新模式（异步引擎）---")
+    headers = get_headers(cookie, token)
+    config = get_config()
+
+    async def run_all():
+        async with async_client_from_config(config) as client:
+            print(f"HTTP 客户端: {client.backend}")
+
+            async def run(idx, fakeid):
+                account_name = account_names.get(idx, "Unknown_Account")
+                print(f"正在检查 fakeid: {fakeid} ({account_name})")
+                listing = update_listing(fakeid, history)
+                new_articles, newest, error = await async_fetch_new_articles(
+                    client, fakeid, token, cookie, **listing)
+                failed = error is not None
+                if failed:
+                    print(f"  获取失败 (错误: {error})，本轮不更新历史记录")
+                valid_articles = record_update_articles(fakeid, account_name, new_articles)
+                pending = articles_to_save(fakeid)
+                if pending:
+                    await async_save_articles(client, pending, headers, account_name, config)
+                if not failed:
+                    advance_update_history(fakeid, history, listing, newest, valid_articles)
+
+            await asyncio.gather(*(run(idx, fakeid) for idx, fakeid in enumerate(fakeids)))
+
+    asyncio.run(run_all())
+    flush_log()
     save_json(HISTORY_FILE, history)
 
+def parse_shard(value):
+    """解析 --shard 参数 i/N（i 从 0 开始）"""
+    try:
+        index, total = (int(x) for x in value.split("/"))
+    except ValueError:
+        raise argparse.ArgumentTypeError("格式应为 i/N，如 0/4")
+    if total < 1 or not 0 <= index < total:
+        raise argparse.ArgumentTypeError("分片编号应满足 0 <= i < N")
+    return index, total
+
+def shard_of(fakeid, total):
+    """按 fakeid 的哈希分片，与 gzh.txt 中的顺序无关，各节点计算结果一致"""
+    return int(hashlib.md5(fakeid.encode("utf-8")).hexdigest(), 16) % total
+
+def shard_dir(index, total):
+    return os.path.join(SHARDS_DIR, f"{index}-of-{total}")
+
+def use_shard(index, total, fakeids):
+    """
+    把状态库、日志和文章目录切换到分片目录
+    本机有公共状态库时复制本分片公众号的水位线，已存档的文章不再重复抓取
+    """
+    global STATE_DB_FILE, SEARCH_DB_FILE, SNAPSHOT_DB_FILE, OUTPUT_FILE, ARTICLES_BASE_DIR, _shard
+    _shard = (index, total)
+    directory = shard_dir(index, total)
+    os.makedirs(directory, exist_ok=True)
+    shared_db = STATE_DB_FILE
+    STATE_DB_FILE = os.path.join(directory, os.path.basename(STATE_DB_FILE))
+    SEARCH_DB_FILE = os.path.join(directory, os.path.basename(SEARCH_DB_FILE))
+    SNAPSHOT_DB_FILE = os.path.join(directory, os.path.basename(SNAPSHOT_DB_FILE))
+    OUTPUT_FILE = os.path.join(directory, os.path.basename(OUTPUT_FILE))
+    ARTICLES_BASE_DIR = os.path.join(directory, os.path.basename(ARTICLES_BASE_DIR))
+    if os.path.exists(shared_db) and fakeids:
+        get_state_store().seed_accounts(shared_db, fakeids)
+    return directory
+
+def mode_backfill(fakeids, token, cookie, account_names, shard=None):
+    """
+    批量存档模式：对所有公众号（或其中一个分片）执行一次完整存档后退出
+    分片时公众号名称仍按其在 gzh.txt 中的原始行号对应
+    """
+    indexed = list(enumerate(fakeids))
+    if shard is not None:
+        index, total = shard
+        indexed = [(i, fakeid) for i, fakeid in indexed if shard_of(fakeid, total) == index]
+        directory = use_shard(index, total, [fakeid for _, fakeid in indexed])
+        print(f"分片 {index}/{total}: {len(indexed)}/{len(fakeids)} 个公众号，输出到 {directory}")
+    names = {n: account_names[i] for n, (i, _) in enumerate(indexed) if i in account_names}
+    mode_archive([fakeid for _, fakeid in indexed], token, cookie, names)
+
+def link_or_copy(source, target):
+    try:
+        os.link(source, target)
+    except OSError:
+        shutil.copy2(source, target)
+
+def merge_shards(directories):
+    """
+    合并分片输出到公共存档：
+    文章文件（含 assets/ 图片）移入公众号文章目录，状态库合并到公共状态库，新文章追加到 wx_poc.txt
+    返回合并的新文章数
+    """
+    store = get_state_store()
+    merged = 0
+    for directory in directories:
+        db_path = os.path.join(directory, os.path.basename(STATE_DB_FILE))
+        if not os.path.exists(db_path):
+            print(f"[Skip] {directory} 中没有状态库")
+            continue
+        articles_dir = os.path.join(directory, os.path.basename(ARTICLES_BASE_DIR))
+        copied = 0
+        for root, _, files in os.walk(articles_dir):
+            target_root = os.path.join(ARTICLES_BASE_DIR, os.path.relpath(root, articles_dir))
+            for name in files:
+                if name.endswith(".part"):
+                    continue
+                target = os.path.join(target_root, name)
+                if not os.path.exists(target):
+                    os.makedirs(target_root, exist_ok=True)
+                    link_or_copy(os.path.join(root, name), target)
+                    copied += 1
+        accounts = store.merge_from(db_path, articles_dir, ARTICLES_BASE_DIR)
+        snapshot_db = os.path.join(directory, os.path.basename(SNAPSHOT_DB_FILE))
+        if os.path.exists(snapshot_db) and get_snapshot_store() is not None:
+            get_snapshot_store().merge_from(snapshot_db, articles_dir, ARTICLES_BASE_DIR)
+        for fakeid, account_name in accounts:
+            merged += len(store.unlogged_articles(fakeid))
+            write_account_log(fakeid, account_name or "Unknown_Account")
+        flush_log()
+        print(f"已合并 {directory}: {len(accounts)} 个公众号，{copied} 个文件")
+    # 检索索引不保存正文，无法直接合并，按合并后的文章补建索引
+    indexed = index_archive()
+    if indexed:
+        print(f"已将 {indexed} 篇合并的文章加入检索索引")
+    return merged
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="微信公众号文章爬虫")
+    parser.add_argument("--import-state", action="store_true",
+                        help=f"将 {OUTPUT_FILE} 和 {HISTORY_FILE} 导入状态库 {STATE_DB_FILE} 后退出")
+    parser.add_argument("--export-log", metavar="FILE",
+                        help=f"从状态库按 {OUTPUT_FILE} 格式导出文章日志后退出")
+    parser.add_argument("--export-articles", metavar="DIR",
+                        help="把分段存储中的文章导出为独立的 Markdown 文件后退出")
+    parser.add_argument("--account", metavar="NAME",
+                        help="配合 --export-articles / --search / --reconvert 使用：只处理该公众号的文章")
+    parser.add_argument("--search", metavar="QUERY", help="全文检索已保存的文章后退出，多个关键词用空格分隔")
+    parser.add_argument("--since", metavar="YYYY-MM-DD", help="配合 --search 使用：起始日期")
+    parser.add_argument("--until", metavar="YYYY-MM-DD", help="配合 --search 使用：截止日期")
+    parser.add_argument("--limit", type=int, default=20, help="配合 --search 使用：最多显示的结果数（默认 20）")
+    parser.add_argument("--reindex", action="store_true", help="重建全文检索索引后退出")
+    parser.add_argument("--reconvert", action="store_true",
+                        help=f"用 {SNAPSHOT_DB_FILE} 中的页面快照重新生成 Markdown 后退出，不重新下载")
+    parser.add_argument("--force", action="store_true", help="配合 --reconvert 使用：未变化的文章也重新转换")
+    parser.add_argument("--backfill", action="store_true",
+                        help="对所有公众号执行一次完整存档后退出，不进入监控循环")
+    parser.add_argument("--shard", type=parse_shard, metavar="i/N",
+                        help=f"配合 --backfill 使用：只处理第 i 个分片（共 N 个，i 从 0 开始），输出到 {SHARDS_DIR}/i-of-N/")
+    parser.add_argument("--merge", nargs="*", metavar="DIR",
+                        help=f"把分片输出合并到公共存档后退出，默认合并 {SHARDS_DIR}/ 下的全部分片")
+    parser.add_argument("--profile", nargs="?", const="profile", metavar="DIR",
+                        help="用 cProfile 分析每轮检查，结果保存到 DIR（默认 profile/）")
+    args = parser.parse_args()
+    if args.shard and not args.backfill:
+        parser.error("--shard 需要和 --backfill 一起使用")
+    return args
+
 def main():
-    config = load_json(CONFIG_FILE)
+    args = parse_args()
+    if args.import_state:
+        store = get_state_store()
+        count = store.import_legacy(load_fakeids_by_name())
+        print(f"已导入 {count} 篇文章记录到 {STATE_DB_FILE}")
+        return
+    if args.export_log:
+        count = get_state_store().export_log(args.export_log)
+        print(f"已导出 {count} 篇文章记录到 {args.export_log}")
+        return
+    if args.search or args.reindex:
+        get_config(reload=True)
+        if get_search_index() is None:
+            print("全文检索未开启（search_index 为 false 或 SQLite 不支持 FTS5）")
+            return
+        if args.reindex:
+            count = index_archive(rebuild=True)
+            print(f"已索引 {count} 篇文章到 {SEARCH_DB_FILE}")
+            return
+        start = time.perf_counter()
+        results = get_search_index().search(args.search, args.account, args.since, args.until, args.limit)
+        for item in results:
+            print(f"{item['date']}  {item['account']}  {item['title']}\n    {item['path']}")
+        print(f"共 {len(results)} 条结果 ({(time.perf_counter() - start) * 1000:.1f} ms)")
+        return
+    if args.reconvert:
+        get_config(reload=True)
+        if get_snapshot_store() is None:
+            print("页面快照未开启（html_snapshots 为 false）")
+            return
+        start = time.perf_counter()
+        converted, skipped = reconvert_snapshots(args.account, args.force)
+        print(f"已重新转换 {converted} 篇文章，{skipped} 篇未变化跳过 ({time.perf_counter() - start:.1f} s)")
+        return
+    if args.export_articles:
+        get_config(reload=True)
+        segments = get_segment_store() or SegmentStore(get_state_store())
+        count = segments.export(args.export_articles, args.account)
+        print(f"已导出 {count} 篇文章到 {args.export_articles}")
+        return
+    if args.merge is not None:
+        directories = args.merge
+        if not directories and os.path.isdir(SHARDS_DIR):
+            directories = sorted(os.path.join(SHARDS_DIR, d) for d in os.listdir(SHARDS_DIR))
+        count = merge_shards(directories)
+        print(f"共合并 {count} 篇新文章")
+        return
+
+    config = get_config(reload=True)
     token = config.get("token")
     cookie = config.get("cookie")
     
@@ -542,32 +4153,52 @@ def main():
     account_names = load_account_names()
     print(f"加载了 {len(account_names)} 个公众号名称")
 
+    global MP_BASE_URL
+    MP_BASE_URL = config.get("mp_base_url", MP_BASE_URL).rstrip("/")
+
+    if config.get("metrics_port"):
+        start_metrics_server(config["metrics_port"], config.get("metrics_host", "127.0.0.1"))
+    if args.profile:
+        os.makedirs(args.profile, exist_ok=True)
+
+    if args.backfill:
+        mode_backfill(fakeids, token, cookie, account_names, args.shard)
+        return
+
     # 持续监控模式
-    config = load_json(CONFIG_FILE)
     check_interval_minutes = config.get("check_interval_minutes", 60)
-    check_interval_seconds = check_interval_minutes * 60
+    scheduler = AccountScheduler.from_config(config)
     
     print("启动持续监控模式...")
-    print(f"每{check_interval_minutes}分钟检查一次公众号更新\n")
+    print(f"默认每{check_interval_minutes}分钟检查一次公众号更新，按各号发文频率自动调整\n")
     
     while True:
         try:
             print(f"\n{'='*60}")
             print(f"开始检查更新 - {time.strftime('%Y-%m-%d %H:%M:%S')}")
             print(f"{'='*60}\n")
+            config = get_config(reload=True)
             
-            # 运行监控检查
-            mode_archive(fakeids, token, cookie, account_names)
+            # 运行监控检查（只处理到期的公众号）
+            if args.profile:
+                with CycleProfiler() as profiler, metrics.timer("cycle"):
+                    mode_archive(fakeids, token, cookie, account_names, scheduler)
+                profiler.dump(os.path.join(args.profile, f"cycle_{time.strftime('%Y%m%d_%H%M%S')}.prof"))
+            else:
+                with metrics.timer("cycle"):
+                    mode_archive(fakeids, token, cookie, account_names, scheduler)
+            if config.get("metrics_file"):
+                metrics.write_jsonl(config["metrics_file"])
             
+            next_check = scheduler.next_due_time(fakeids)
             print(f"\n{'='*60}")
             print(f"检查完成 - {time.strftime('%Y-%m-%d %H:%M:%S')}")
-            next_check_time = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(time.time() + check_interval_seconds))
+            next_check_time = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(next_check))
             print(f"下次检查时间: {next_check_time}")
             print(f"{'='*60}\n")
             
-            # 等待指定时间
-            print(f"等待{check_interval_minutes}分钟后进行下一次检查...")
-            time.sleep(check_interval_seconds)
+            # 等待到下一个公众号到期
+            time.sleep(max(1, next_check - time.time()))
             
         except KeyboardInterrupt:
             print("\n\n监控已停止")